@@ -7,9 +7,14 @@ from dotenv import load_dotenv
 load_dotenv()
 
 from core.template_profiler import profile_template
-from core.llm_client import generate_deck, edit_deck
-from core.renderer import render_pptx
+from core.llm_client import generate_deck, edit_deck, generate_deck_chunked, CHUNKED_THRESHOLD
+from core.renderer import render_pptx, ProgressiveRenderer
 from core.utils import save_uploaded_file
+from core.coordinator import coordinator, input_hash, file_digest
+from core.artifact_store import store
+from core.preview import gallery, PENDING, READY, UNAVAILABLE
+from core.schemas import ImageRef
+from core.media import list_allowed_images, store_image
 
 st.set_page_config(page_title="PPT Generator", layout="wide")
 
@@ -24,32 +29,154 @@ if "current_deck_idx" not in st.session_state:
     st.session_state.current_deck_idx = -1
 if "ppt_bytes" not in st.session_state:
     st.session_state.ppt_bytes = None
+# Artifact store ids pinned by this session (released when replaced or cleared)
+if "template_artifact_id" not in st.session_state:
+    st.session_state.template_artifact_id = None
+if "ppt_artifact_id" not in st.session_state:
+    st.session_state.ppt_artifact_id = None
+# Uploaded images, pinned while they stay in the uploader: {uploader file id: (artifact id, file name)}
+if "image_uploads" not in st.session_state:
+    st.session_state.image_uploads = {}
 
-def render_preview_to_bytes(deck_spec, template_path, template_profile):
-    """Renders the PPTX to a bytes buffer."""
-    import tempfile
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".pptx") as tmp:
-        render_pptx(template_path, deck_spec, tmp.name, template_profile)
-        with open(tmp.name, "rb") as f:
-            ppt_bytes = f.read()
+def pin_artifact(state_key, artifact_id):
+    """Pins artifact_id for this session under state_key, releasing whatever was pinned before."""
+    if st.session_state[state_key] == artifact_id:
+        return
+    if artifact_id:
+        store.acquire(artifact_id)
+    store.release(st.session_state[state_key])
+    st.session_state[state_key] = artifact_id
+
+# Pins alone expire after the ref TTL, so touch pinned artifacts on every run. The template is
+# read through the store, so a template evicted anyway is re-uploaded instead of read from a dead path.
+if st.session_state.template_artifact_id:
+    try:
+        st.session_state.template_path = store.path(st.session_state.template_artifact_id)
+    except KeyError:
+        st.session_state.template_artifact_id = None
+        st.session_state.template_profile = None
+        st.session_state.template_path = None
+if st.session_state.ppt_artifact_id:
     try:
-        os.remove(tmp.name)
-    except:
-        pass
-    return ppt_bytes
+        store.path(st.session_state.ppt_artifact_id)
+    except KeyError:
+        st.session_state.ppt_artifact_id = None
+for file_id, (image_id, _) in list(st.session_state.image_uploads.items()):
+    try:
+        store.path(image_id)
+    except KeyError:
+        del st.session_state.image_uploads[file_id]
+
+def sync_image_uploads(files):
+    """Stores and pins newly uploaded images, and unpins the ones removed from the uploader."""
+    uploads = st.session_state.image_uploads
+    current = {f.file_id: f for f in files}
+    for file_id in list(uploads):
+        if file_id not in current:
+            store.release(uploads.pop(file_id)[0])
+    for file_id, f in current.items():
+        if file_id in uploads:
+            continue
+        try:
+            image_id = store_image(f.getvalue(), f.name)
+        except ValueError as e:
+            st.warning(str(e))
+            continue
+        store.acquire(image_id)
+        uploads[file_id] = (image_id, f.name)
+
+def available_images():
+    """Images the writer may put in picture placeholders: files in PPTLLM_IMAGE_DIRS plus this session's uploads."""
+    images = list_allowed_images()
+    images.update({image_id: name for image_id, name in st.session_state.image_uploads.values()})
+    return images
+
+def render_preview_to_bytes(deck_spec, template_path, template_profile):
+    """Renders the PPTX into the artifact store, pins it for this session and returns its bytes."""
+    # Identical in-flight renders across sessions are shared
+    key = input_hash("render", file_digest(template_path), template_profile, deck_spec)
+    artifact_id = coordinator.renders.do(key, lambda: _render_to_store(deck_spec, template_path, template_profile))
+    pin_artifact("ppt_artifact_id", artifact_id)
+    # Thumbnails for the gallery are built in the background and cached per version / slide
+    gallery.request(artifact_id, deck_spec, template_path, template_profile)
+    return store.read_bytes(artifact_id)
+
+def _render_to_store(deck_spec, template_path, template_profile):
+    with store.tmp_file(".pptx") as tmp_path:
+        render_pptx(template_path, deck_spec, tmp_path, template_profile)
+        return store.put_file(tmp_path, kind="pptx", move=True)
+
+GALLERY_PAGE_SIZE = 12
+GALLERY_COLUMNS = 3
+
+def show_slide_gallery(pptx_id, slide_count, polling):
+    """Shows one page of downscaled slide thumbnails; polls while they are still being built."""
+    status = gallery.status(pptx_id)
+    if status == PENDING:
+        st.caption("Rendering slide thumbnails in the background...")
+        return
+    if polling:
+        # Thumbnails just landed: rerun the page once so the fragment stops polling
+        st.rerun()
+    if status == UNAVAILABLE:
+        st.info(
+            f"Slide thumbnails are unavailable (LibreOffice may not be installed): {gallery.error(pptx_id)}. "
+            "They are retried on a later run; see the Text Preview tab."
+        )
+        return
+    if status != READY:
+        st.caption("Slide thumbnails are not available yet.")
+        return
+
+    pages = max(1, -(-slide_count // GALLERY_PAGE_SIZE))
+    page = st.number_input("Page", min_value=1, max_value=pages, value=1, key=f"gallery_page_{pptx_id}") if pages > 1 else 1
+    start = (page - 1) * GALLERY_PAGE_SIZE
+    thumbs = gallery.thumbnails(pptx_id, start, GALLERY_PAGE_SIZE)
+    cols = st.columns(GALLERY_COLUMNS)
+    for i, path in enumerate(thumbs):
+        with cols[i % GALLERY_COLUMNS]:
+            if path:
+                st.image(path, caption=f"Slide {start + i + 1}", width="stretch")
+            else:
+                st.caption(f"Slide {start + i + 1}: thumbnail evicted")
 
 # --- Sidebar ---
 st.sidebar.title("Settings")
-slide_count = st.sidebar.number_input("Target Slide Count", min_value=1, max_value=50, value=10)
+slide_count = st.sidebar.number_input("Target Slide Count", min_value=1, max_value=300, value=10)
 tone = st.sidebar.selectbox("Audience / Tone", ["Formal / Executive", "Neutral / Informative", "Casual", "Technical"])
 
 if st.sidebar.button("Clear Session"):
+    pin_artifact("template_artifact_id", None)
+    pin_artifact("ppt_artifact_id", None)
+    for image_id, _ in st.session_state.image_uploads.values():
+        store.release(image_id)
+    st.session_state.image_uploads = {}
     for key in ["template_profile", "template_path", "deck_history", "current_deck_idx", "ppt_bytes"]:
         st.session_state[key] = None if key != "deck_history" else []
         if key == "current_deck_idx": st.session_state[key] = -1
     st.sidebar.success("Session cleared.")
     st.rerun()
 
+# Process-wide queue state, shared by every session on this server
+with st.sidebar.expander("Server Load"):
+    stats = coordinator.stats()
+    for gate in ["llm", "soffice"]:
+        g = stats[gate]
+        st.caption(
+            f"**{gate}**: {g['active']}/{g['limit']} active, {g['queue_depth']} queued, "
+            f"avg wait {g['avg_wait_s']:.1f}s (max {g['max_wait_s']:.1f}s)"
+        )
+    st.caption(
+        f"**generations**: {stats['generations']['in_flight']} in flight, "
+        f"{stats['generations']['coalesced']} deduplicated"
+    )
+    disk = store.stats()
+    st.caption(
+        f"**storage**: {disk['count']} artifacts ({disk['pinned']} pinned), "
+        f"{disk['total_bytes'] / 2**20:.0f}/{disk['max_bytes'] / 2**20:.0f} MB, "
+        f"{disk['disk_free_bytes'] / 2**30:.1f} GB free"
+    )
+
 # --- Main Flow ---
 st.title("PPT Generator + Editor")
 
@@ -61,6 +188,7 @@ if uploaded_file is not None and st.session_state.template_profile is None:
     with st.spinner("Profiling template..."):
         file_path = save_uploaded_file(uploaded_file)
         if file_path:
+            pin_artifact("template_artifact_id", store.id_for_path(file_path))
             st.session_state.template_path = file_path
             st.session_state.template_profile = profile_template(file_path, uploaded_file.name)
         else:
@@ -83,12 +211,51 @@ if st.session_state.template_profile:
     st.header("Step 2: Generate Deck")
     
     prompt = st.text_area("Content Prompt / Outline", height=150, placeholder="Paste your outline or presentation topic here...")
+    image_files = st.file_uploader(
+        "Images for picture placeholders (optional)", type=["png", "jpg", "jpeg", "gif", "bmp"],
+        accept_multiple_files=True, key="image_uploader"
+    )
+    sync_image_uploads(image_files or [])
     
     if st.button("Generate Deck"):
         if not prompt.strip():
             st.warning("Please provide a prompt.")
         elif not os.environ.get("OPENAI_API_KEY"):
             st.error("OPENAI_API_KEY environment variable is not set.")
+        elif slide_count > CHUNKED_THRESHOLD:
+            # Large decks: generate section by section and append each chunk to the PPTX as it lands
+            progress = st.progress(0.0, text="Planning sections...")
+            renderer = ProgressiveRenderer(st.session_state.template_path, st.session_state.template_profile)
+
+            def on_chunk(chunk_no, total_chunks, chunk_deck):
+                renderer.add_slides(chunk_deck.slides)
+                progress.progress(chunk_no / total_chunks, text=f"Generated part {chunk_no} of {total_chunks} ({renderer.slide_count} slides)")
+
+            try:
+                deck_spec = generate_deck_chunked(
+                    profile=st.session_state.template_profile,
+                    prompt=prompt,
+                    slide_count=int(slide_count),
+                    tone=tone,
+                    template_path=st.session_state.template_path,
+                    on_chunk=on_chunk,
+                    images=available_images()
+                )
+                st.session_state.deck_history = [deck_spec]
+                st.session_state.current_deck_idx = 0
+                if renderer.slide_count == len(deck_spec.slides):
+                    buf = io.BytesIO()
+                    renderer.save(buf)
+                    pin_artifact("ppt_artifact_id", store.put_bytes(buf.getvalue(), suffix=".pptx", kind="pptx"))
+                    gallery.request(st.session_state.ppt_artifact_id, deck_spec, st.session_state.template_path, st.session_state.template_profile)
+                    st.session_state.ppt_bytes = buf.getvalue()
+                else:
+                    # The incremental file is incomplete (a chunk was not appended), so render from the spec
+                    st.session_state.ppt_bytes = render_preview_to_bytes(deck_spec, st.session_state.template_path, st.session_state.template_profile)
+                progress.empty()
+                st.success("Generation complete!")
+            except Exception as e:
+                st.error(f"Generation failed: {e}")
         else:
             with st.spinner("Generating deck... This may take up to 20-30 seconds."):
                 try:
@@ -97,7 +264,8 @@ if st.session_state.template_profile:
                         prompt=prompt,
                         slide_count=str(slide_count),
                         tone=tone,
-                        template_path=st.session_state.template_path
+                        template_path=st.session_state.template_path,
+                        images=available_images()
                     )
                     st.session_state.deck_history = [deck_spec]
                     st.session_state.current_deck_idx = 0
@@ -116,7 +284,19 @@ if len(st.session_state.deck_history) > 0:
     col1, col2 = st.columns([1, 1])
     
     with col1:
-        st.markdown("### Text Preview")
+        gallery_tab, text_tab = st.tabs(["Slides", "Text Preview"])
+
+    with gallery_tab:
+        pptx_id = st.session_state.ppt_artifact_id
+        if pptx_id:
+            # Versions dropped from the gallery index, or failed ones past their cooldown, are rebuilt
+            if gallery.status(pptx_id) in (None, UNAVAILABLE) and st.session_state.template_path:
+                gallery.request(pptx_id, current_deck, st.session_state.template_path, st.session_state.template_profile)
+            # Only poll while thumbnails are still pending; afterwards the fragment is static
+            polling = gallery.status(pptx_id) == PENDING
+            st.fragment(show_slide_gallery, run_every=2 if polling else None)(pptx_id, len(current_deck.slides), polling)
+
+    with text_tab:
         # Lightweight Text Preview
         st.markdown(f"**Deck Title:** {current_deck.deck_title}")
         for slide in current_deck.slides:
@@ -125,7 +305,9 @@ if len(st.session_state.deck_history) > 0:
             for field in slide.fields:
                 k = field.key
                 v = field.value
-                if isinstance(v, list):
+                if isinstance(v, ImageRef):
+                    st.markdown(f"**{k}:** image `{v.image}`")
+                elif isinstance(v, list):
                     st.markdown(f"**{k}:**")
                     for bullet in v:
                         st.markdown(f"- {bullet}")
@@ -149,7 +331,7 @@ if len(st.session_state.deck_history) > 0:
             if edit_instruction.strip() and os.environ.get("OPENAI_API_KEY"):
                 with st.spinner("Applying edits..."):
                     try:
-                        new_deck = edit_deck(st.session_state.template_profile, current_deck, edit_instruction, st.session_state.template_path)
+                        new_deck = edit_deck(st.session_state.template_profile, current_deck, edit_instruction, st.session_state.template_path, available_images())
                         # Keep max 5 history states
                         st.session_state.deck_history = st.session_state.deck_history[:st.session_state.current_deck_idx + 1]
                         st.session_state.deck_history.append(new_deck)
@@ -0,0 +1,266 @@
+import os
+import time
+import uuid
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_DIR = os.environ.get("PPTLLM_ARTIFACT_DIR", os.path.join(tempfile.gettempdir(), "pptllm-artifacts"))
+ARTIFACT_MAX_BYTES = int(float(os.environ.get("PPTLLM_ARTIFACT_MAX_MB", "2048")) * 1024 * 1024)
+ARTIFACT_MAX_AGE_S = float(os.environ.get("PPTLLM_ARTIFACT_MAX_AGE_HOURS", "24")) * 3600
+# References not touched for this long are treated as leaked (e.g. a browser tab that was closed)
+ARTIFACT_REF_TTL_S = float(os.environ.get("PPTLLM_ARTIFACT_REF_TTL_HOURS", "24")) * 3600
+
+
+class ArtifactStore:
+    """
+    Content-addressed store for templates, rendered PPTX files, PDFs and thumbnails.
+    Artifacts are stored once per content hash under <root>/<kind>/<sha256><suffix>; the file name
+    doubles as the artifact id. Sessions pin what they use with acquire()/release(), and gc()
+    evicts unpinned artifacts by age and, when over the size cap, least-recently used first.
+    """
+
+    def __init__(self, root: str = ARTIFACT_DIR, max_bytes: int = ARTIFACT_MAX_BYTES,
+                 max_age_s: float = ARTIFACT_MAX_AGE_S, ref_ttl_s: float = ARTIFACT_REF_TTL_S):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age_s = max_age_s
+        self.ref_ttl_s = ref_ttl_s
+        self._lock = threading.RLock()
+        self._index: Dict[str, Dict] = {}
+        self._derived: Dict[tuple, List[str]] = {}
+        self._total_bytes = 0
+        self._last_gc = 0.0
+        self.evicted = 0
+        os.makedirs(os.path.join(self.root, "tmp"), exist_ok=True)
+        self._scan()
+
+    def _scan(self):
+        """Adopts artifacts left over from a previous process so they can be collected."""
+        for kind in os.listdir(self.root):
+            kind_dir = os.path.join(self.root, kind)
+            if kind == "tmp" or not os.path.isdir(kind_dir):
+                continue
+            for name in os.listdir(kind_dir):
+                st = os.stat(os.path.join(kind_dir, name))
+                self._index[name] = {"kind": kind, "size": st.st_size, "refs": 0, "last_access": st.st_mtime}
+                self._total_bytes += st.st_size
+
+    # --- Writing ---
+
+    def tmp_path(self, suffix: str = "") -> str:
+        """A fresh scratch path on the store's filesystem, for tools that must write to a path."""
+        return os.path.join(self.root, "tmp", f"{uuid.uuid4().hex}{suffix}")
+
+    @contextmanager
+    def tmp_file(self, suffix: str = ""):
+        """A scratch file path that is removed on exit unless it was consumed (e.g. put_file(move=True))."""
+        path = self.tmp_path(suffix)
+        try:
+            yield path
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+
+    @contextmanager
+    def scratch_dir(self):
+        path = self.tmp_path()
+        os.makedirs(path)
+        try:
+            yield path
+        finally:
+            shutil.rmtree(path, ignore_errors=True)
+
+    def put_bytes(self, data: bytes, suffix: str = "", kind: str = "blob") -> str:
+        """Stores data (once per content hash) and returns its artifact id."""
+        artifact_id = hashlib.sha256(data).hexdigest() + suffix
+        with self._lock:
+            if self._touch(artifact_id):
+                return artifact_id
+        tmp = self.tmp_path(suffix)
+        with open(tmp, "wb") as f:
+            f.write(data)
+        return self._commit(tmp, artifact_id, kind, len(data))
+
+    def put_file(self, path: str, kind: str = "blob", move: bool = False) -> str:
+        """Stores a file's contents and returns its artifact id. With move=True the source is consumed."""
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        artifact_id = h.hexdigest() + os.path.splitext(path)[1]
+        with self._lock:
+            if self._touch(artifact_id):
+                if move:
+                    os.remove(path)
+                return artifact_id
+        tmp = self.tmp_path()
+        if move:
+            shutil.move(path, tmp)
+        else:
+            shutil.copyfile(path, tmp)
+        return self._commit(tmp, artifact_id, kind, os.path.getsize(tmp))
+
+    def _commit(self, tmp: str, artifact_id: str, kind: str, size: int) -> str:
+        final = os.path.join(self.root, kind, artifact_id)
+        os.makedirs(os.path.dirname(final), exist_ok=True)
+        with self._lock:
+            if self._touch(artifact_id):
+                # Lost a race with an identical write
+                os.remove(tmp)
+                return artifact_id
+            os.replace(tmp, final)
+            self._index[artifact_id] = {"kind": kind, "size": size, "refs": 0, "last_access": time.time()}
+            self._total_bytes += size
+        self.maybe_gc()
+        return artifact_id
+
+    def _touch(self, artifact_id: str) -> bool:
+        meta = self._index.get(artifact_id)
+        if meta is None:
+            return False
+        meta["last_access"] = time.time()
+        return True
+
+    # --- Reading ---
+
+    def path(self, artifact_id: str) -> str:
+        with self._lock:
+            meta = self._index.get(artifact_id)
+            if meta is None:
+                raise KeyError(f"Unknown artifact: {artifact_id}")
+            meta["last_access"] = time.time()
+            return os.path.join(self.root, meta["kind"], artifact_id)
+
+    def exists(self, artifact_id: str) -> bool:
+        with self._lock:
+            return artifact_id in self._index
+
+    def read_bytes(self, artifact_id: str) -> bytes:
+        with open(self.path(artifact_id), "rb") as f:
+            return f.read()
+
+    @staticmethod
+    def id_for_path(path: str) -> str:
+        """Artifact ids are the stored file names, so any store path maps back to its id."""
+        return os.path.basename(path)
+
+    # --- Derived artifacts (e.g. PDF and thumbnails of a rendered PPTX) ---
+
+    def set_derived(self, source_digest: str, relation: str, artifact_ids: List[str]):
+        with self._lock:
+            self._derived[(source_digest, relation)] = list(artifact_ids)
+
+    def get_derived(self, source_digest: str, relation: str) -> Optional[List[str]]:
+        """Returns previously derived artifact ids, or None if unknown or partly evicted."""
+        with self._lock:
+            ids = self._derived.get((source_digest, relation))
+            if ids is None or not all(i in self._index for i in ids):
+                return None
+            for i in ids:
+                self._touch(i)
+            return list(ids)
+
+    # --- Reference counting ---
+
+    def acquire(self, artifact_id: str):
+        with self._lock:
+            meta = self._index.get(artifact_id)
+            if meta is None:
+                raise KeyError(f"Unknown artifact: {artifact_id}")
+            meta["refs"] += 1
+            meta["last_access"] = time.time()
+
+    def release(self, artifact_id: Optional[str]):
+        if not artifact_id:
+            return
+        with self._lock:
+            meta = self._index.get(artifact_id)
+            if meta is not None and meta["refs"] > 0:
+                meta["refs"] -= 1
+
+    # --- Garbage collection ---
+
+    def maybe_gc(self):
+        """Runs gc() when over the size cap, or at most every few minutes for age-based eviction."""
+        now = time.time()
+        if self._total_bytes > self.max_bytes or now - self._last_gc > min(300.0, self.max_age_s):
+            self.gc()
+
+    def gc(self) -> int:
+        """Evicts expired and (if over the size cap) least-recently used unpinned artifacts."""
+        now = time.time()
+        removed = 0
+        with self._lock:
+            self._last_gc = now
+
+            def evictable(meta):
+                return meta["refs"] == 0 or now - meta["last_access"] > self.ref_ttl_s
+
+            candidates = sorted(
+                (aid for aid, meta in self._index.items() if evictable(meta)),
+                key=lambda aid: self._index[aid]["last_access"],
+            )
+            for aid in candidates:
+                meta = self._index[aid]
+                expired = now - meta["last_access"] > self.max_age_s
+                if not expired and self._total_bytes <= self.max_bytes:
+                    continue
+                try:
+                    os.remove(os.path.join(self.root, meta["kind"], aid))
+                except FileNotFoundError:
+                    pass
+                self._total_bytes -= meta["size"]
+                del self._index[aid]
+                removed += 1
+            self.evicted += removed
+
+        # Scratch files older than the age limit belong to crashed or abandoned jobs
+        tmp_dir = os.path.join(self.root, "tmp")
+        for name in os.listdir(tmp_dir):
+            p = os.path.join(tmp_dir, name)
+            try:
+                if now - os.path.getmtime(p) <= self.max_age_s:
+                    continue
+                if os.path.isdir(p):
+                    shutil.rmtree(p)
+                else:
+                    os.remove(p)
+            except OSError:
+                pass
+
+        if removed:
+            logger.info("artifact gc: evicted %d artifacts, %d bytes in use", removed, self._total_bytes)
+        return removed
+
+    def stats(self) -> Dict:
+        with self._lock:
+            by_kind: Dict[str, Dict[str, int]] = {}
+            pinned = 0
+            for meta in self._index.values():
+                k = by_kind.setdefault(meta["kind"], {"count": 0, "bytes": 0})
+                k["count"] += 1
+                k["bytes"] += meta["size"]
+                pinned += 1 if meta["refs"] > 0 else 0
+            total_bytes = self._total_bytes
+            count = len(self._index)
+        disk = shutil.disk_usage(self.root)
+        return {
+            "root": self.root,
+            "count": count,
+            "pinned": pinned,
+            "total_bytes": total_bytes,
+            "max_bytes": self.max_bytes,
+            "evicted": self.evicted,
+            "by_kind": by_kind,
+            "disk_free_bytes": disk.free,
+        }
+
+
+store = ArtifactStore()
@@ -0,0 +1,194 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MAX_CONCURRENT_LLM = int(os.environ.get("PPTLLM_MAX_CONCURRENT_LLM", "8"))
+MAX_CONCURRENT_SOFFICE = int(os.environ.get("PPTLLM_MAX_CONCURRENT_SOFFICE", "2"))
+
+
+def input_hash(*parts: Any) -> str:
+    """Stable sha256 over a mix of str/bytes/JSON-serializable (or pydantic) parts."""
+    h = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, bytes):
+            data = part
+        elif isinstance(part, str):
+            data = part.encode("utf-8")
+        elif hasattr(part, "model_dump_json"):
+            data = part.model_dump_json().encode("utf-8")
+        else:
+            data = json.dumps(part, sort_keys=True, default=str).encode("utf-8")
+        h.update(len(data).to_bytes(8, "big"))
+        h.update(data)
+    return h.hexdigest()
+
+
+_file_digest_cache: Dict[Tuple[str, int, int], str] = {}
+_file_digest_lock = threading.Lock()
+
+
+def file_digest(path: str) -> str:
+    """sha256 of a file's contents, cached by (path, mtime, size)."""
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+    with _file_digest_lock:
+        if key in _file_digest_cache:
+            return _file_digest_cache[key]
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    digest = h.hexdigest()
+    with _file_digest_lock:
+        _file_digest_cache[key] = digest
+    return digest
+
+
+class _LeaderAborted(Exception):
+    """Tells coalesced callers that the leader stopped without a result or an error of its own."""
+
+
+class SingleFlight:
+    """Collapses concurrent calls with the same key into one execution whose result all callers share."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.executions = 0
+        self.coalesced = 0
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        while True:
+            with self._lock:
+                future = self._inflight.get(key)
+                leader = future is None
+                if leader:
+                    future = Future()
+                    self._inflight[key] = future
+                    self.executions += 1
+                else:
+                    self.coalesced += 1
+
+            if not leader:
+                logger.info("singleflight %s: joined in-flight call %s", self.name, key[:12])
+                try:
+                    return future.result()
+                except _LeaderAborted:
+                    # The leader was interrupted rather than failing; run it again, possibly as the new leader
+                    continue
+
+            try:
+                result = fn()
+            except Exception as e:
+                self._finish(key, future, exception=e)
+                raise
+            except BaseException:
+                # KeyboardInterrupt, a session's rerun/stop etc. belong to the leader's caller only
+                self._finish(key, future, exception=_LeaderAborted())
+                raise
+            self._finish(key, future, result=result)
+            return result
+
+    def _finish(self, key: str, future: Future, result: Any = None, exception: Optional[BaseException] = None):
+        # Free the key before waking followers, so a retrying follower can become the new leader
+        with self._lock:
+            self._inflight.pop(key, None)
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"in_flight": len(self._inflight), "executions": self.executions, "coalesced": self.coalesced}
+
+
+class AdmissionGate:
+    """Caps concurrent jobs of one kind and records queue depth and wait times."""
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = max(1, limit)
+        self._sem = threading.BoundedSemaphore(self.limit)
+        self._lock = threading.Lock()
+        self.waiting = 0
+        self.active = 0
+        self.admitted = 0
+        self.total_wait_s = 0.0
+        self.max_wait_s = 0.0
+        self.last_wait_s = 0.0
+
+    def acquire(self, blocking: bool = True) -> Optional[float]:
+        """Takes a slot and returns the time waited, or None if non-blocking and none is free."""
+        start = time.perf_counter()
+        with self._lock:
+            self.waiting += 1
+        acquired = self._sem.acquire(blocking)
+        waited = time.perf_counter() - start
+        with self._lock:
+            self.waiting -= 1
+            if not acquired:
+                return None
+            self.active += 1
+            self.admitted += 1
+            self.total_wait_s += waited
+            self.max_wait_s = max(self.max_wait_s, waited)
+            self.last_wait_s = waited
+        if waited > 0.5:
+            logger.info("admission %s: waited %.2fs for a slot", self.name, waited)
+        return waited
+
+    def release(self):
+        with self._lock:
+            self.active -= 1
+        self._sem.release()
+
+    @contextmanager
+    def slot(self):
+        waited = self.acquire()
+        try:
+            yield waited
+        finally:
+            self.release()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "limit": self.limit,
+                "active": self.active,
+                "queue_depth": self.waiting,
+                "admitted": self.admitted,
+                "avg_wait_s": self.total_wait_s / self.admitted if self.admitted else 0.0,
+                "max_wait_s": self.max_wait_s,
+                "last_wait_s": self.last_wait_s,
+            }
+
+
+class Coordinator:
+    """Process-wide coordination shared by every Streamlit session in this server process."""
+
+    def __init__(self, max_llm: int = MAX_CONCURRENT_LLM, max_soffice: int = MAX_CONCURRENT_SOFFICE):
+        self.generations = SingleFlight("generations")
+        self.renders = SingleFlight("renders")
+        self.llm = AdmissionGate("llm", max_llm)
+        self.soffice = AdmissionGate("soffice", max_soffice)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        return {
+            "generations": self.generations.stats(),
+            "renders": self.renders.stats(),
+            "llm": self.llm.stats(),
+            "soffice": self.soffice.stats(),
+        }
+
+
+coordinator = Coordinator()
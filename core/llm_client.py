@@ -1,11 +1,22 @@
 import os
 import json
+import logging
 from openai import OpenAI
 from pydantic import ValidationError
-from typing import Optional
+from typing import Callable, Dict, List, Optional
 from dotenv import load_dotenv
 
-from core.schemas import TemplateProfile, DeckSpec
+from core.schemas import TemplateProfile, DeckSpec, DeckOutline, SectionPlan, ImageRef
+from core.prompt_budget import (
+    PROMPT_TOKEN_BUDGET,
+    PLANNER_RESERVE_TOKENS,
+    compact_deck_encoding,
+    mentioned_slides,
+    count_tokens,
+    truncate_to_tokens,
+    line_range,
+)
+from core.coordinator import coordinator, input_hash, file_digest
 
 load_dotenv()
 
@@ -19,12 +30,43 @@ You MUST only use the 'allowed_layout_ids' provided to you.
 You MUST only fill fields that exist for the chosen layout.
 """
 
-from core.multi_agent import app, AgentState
+from core.multi_agent import app, AgentState, plan_sections
 
-def generate_deck(profile: TemplateProfile, prompt: str, slide_count: str, tone: str, template_path: str) -> DeckSpec:
+logger = logging.getLogger(__name__)
+
+# Decks above this size are generated section by section (see generate_deck_chunked)
+CHUNKED_THRESHOLD = int(os.environ.get("PPTLLM_CHUNKED_THRESHOLD", "25"))
+CHUNK_SIZE = int(os.environ.get("PPTLLM_CHUNK_SIZE", "12"))
+CHUNK_MAX_RETRIES = int(os.environ.get("PPTLLM_CHUNK_MAX_RETRIES", "2"))
+# How much of the user's prompt is repeated in every chunk prompt
+CHUNK_TOPIC_TOKENS = 1500
+# How much of a section's own source lines (cited by the section planner) its chunks receive
+CHUNK_SOURCE_TOKENS = 4000
+
+def _request_key(kind: str, profile: TemplateProfile, template_path: str, *parts) -> str:
+    """Identifies a generation by its inputs; uploads of the same template hash identically."""
+    template_digest = file_digest(template_path) if template_path else ""
+    return input_hash(kind, template_digest, profile.model_dump(exclude={"template_name"}), *parts)
+
+def generate_deck(
+    profile: TemplateProfile, prompt: str, slide_count: str, tone: str, template_path: str,
+    images: Optional[Dict[str, str]] = None,
+) -> DeckSpec:
+    """images ({reference: label}) are offered to the writer for picture placeholders."""
+    # Identical in-flight generations from other sessions share one graph run
+    key = _request_key("generate", profile, template_path, prompt, slide_count, tone, images or {})
+    deck = coordinator.generations.do(key, lambda: _generate_deck(profile, prompt, slide_count, tone, template_path, images))
+    return deck.model_copy(deep=True)
+
+def _generate_deck(
+    profile: TemplateProfile, prompt: str, slide_count: str, tone: str, template_path: str,
+    images: Optional[Dict[str, str]] = None,
+) -> DeckSpec:
     initial_state = {
         "profile": profile,
         "prompt": prompt,
+        "prompt_tokens_saved": 0,
+        "available_images": dict(images or {}),
         "slide_count": slide_count,
         "tone": tone,
         "template_path": template_path,
@@ -44,19 +86,61 @@ def generate_deck(profile: TemplateProfile, prompt: str, slide_count: str, tone:
         
     return final_state["draft_deck_spec"]
 
-def edit_deck(profile: TemplateProfile, current_deck: DeckSpec, instruction: str, template_path: str) -> DeckSpec:
-    # For MVP editing, we can route a specialized edit instruction through the same graph
-    # We prefix the prompt with current state.
-    edit_prompt = (
-        f"CURRENT DECK STATE:\n{current_deck.model_dump_json()}\n\n"
+def edit_deck(
+    profile: TemplateProfile, current_deck: DeckSpec, instruction: str, template_path: str,
+    images: Optional[Dict[str, str]] = None,
+) -> DeckSpec:
+    key = _request_key("edit", profile, template_path, current_deck, instruction, images or {})
+    deck = coordinator.generations.do(key, lambda: _edit_deck(profile, current_deck, instruction, template_path, images))
+    return deck.model_copy(deep=True)
+
+def _edit_deck(
+    profile: TemplateProfile, current_deck: DeckSpec, instruction: str, template_path: str,
+    images: Optional[Dict[str, str]] = None,
+) -> DeckSpec:
+    # For MVP editing, we can route a specialized edit instruction through the same graph.
+    # The graph rewrites whatever deck state it is given, so that state is never summarised:
+    # a deck too large for the budget is edited slide-wise (only the slides the instruction
+    # names) and merged back, or the edit is refused.
+    # Images already in the deck stay usable next to the ones offered for this edit
+    in_deck = {f.value.image: "already in the deck" for s in current_deck.slides for f in s.fields if isinstance(f.value, ImageRef)}
+    images = {**in_deck, **(images or {})}
+    header = (
         f"USER EDIT INSTRUCTION:\n{instruction}\n\n"
-        f"Please redesign the deck narrative and structure applying these changes."
+        f"Please redesign the deck narrative and structure applying these changes.\n\n"
+        f"CURRENT DECK STATE:\n"
     )
-    
+    deck_state = compact_deck_encoding(current_deck)
+    if count_tokens(header + deck_state) <= PROMPT_TOKEN_BUDGET - PLANNER_RESERVE_TOKENS:
+        return _run_edit(profile, header + deck_state, current_deck, deck_state, len(current_deck.slides), images, template_path)
+
+    targets = mentioned_slides(current_deck, instruction)
+    if not targets:
+        raise ValueError(
+            f"This deck ({len(current_deck.slides)} slides) is too large to rewrite in one edit. "
+            f"Name the slides to change, e.g. 'slide 12' or 'slides 3-5'."
+        )
+    subset = DeckSpec(deck_title=current_deck.deck_title, slides=[current_deck.slides[i] for i in targets])
+    header = (
+        f"USER EDIT INSTRUCTION:\n{instruction}\n\n"
+        f"Only the slides below are being edited; the rest of the deck stays as it is. "
+        f"Return only the edited versions of these slides (no title, agenda or closing slides).\n\n"
+        f"SLIDES TO EDIT:\n"
+    )
+    subset_state = compact_deck_encoding(subset)
+    if count_tokens(header + subset_state) > PROMPT_TOKEN_BUDGET - PLANNER_RESERVE_TOKENS:
+        raise ValueError(f"The {len(targets)} slides named in the edit are too large to rewrite at once. Edit fewer slides per instruction.")
+    edited = _run_edit(profile, header + subset_state, current_deck, subset_state, len(targets), images, template_path)
+    return _merge_edited_slides(current_deck, targets, edited)
+
+def _run_edit(profile, edit_prompt, current_deck, deck_state, slide_count, images, template_path) -> DeckSpec:
     initial_state = {
         "profile": profile,
         "prompt": edit_prompt,
-        "slide_count": str(len(current_deck.slides)),
+        # Reported with the planner call that actually sends this prompt
+        "prompt_tokens_saved": count_tokens(current_deck.model_dump_json()) - count_tokens(deck_state),
+        "available_images": images,
+        "slide_count": str(slide_count),
         "tone": "Keep current tone",
         "template_path": template_path,
         "layouts_context": "",
@@ -72,3 +156,181 @@ def edit_deck(profile: TemplateProfile, current_deck: DeckSpec, instruction: str
         raise ValueError(f"Agent failed to edit valid deck: {final_state.get('review_feedback')}")
         
     return final_state["draft_deck_spec"]
+
+def _merge_edited_slides(deck: DeckSpec, targets: List[int], edited: DeckSpec) -> DeckSpec:
+    """
+    Puts a slide-wise edit back into the full deck. Edited slides replace the targeted ones in
+    order and keep their slide ids; extra slides go after the last target, and targets the edit
+    dropped are removed. Every other slide is left untouched.
+    """
+    replacements = dict(zip(targets, edited.slides))
+    extra = edited.slides[len(targets):]
+    used_ids = {s.slide_id for s in deck.slides}
+    slides = []
+    for i, slide in enumerate(deck.slides):
+        if i in replacements:
+            slides.append(replacements[i].model_copy(update={"slide_id": slide.slide_id}))
+        elif i not in targets:
+            slides.append(slide)
+        if i == targets[-1]:
+            for new_slide in extra:
+                n = len(used_ids) + 1
+                while f"s{n}" in used_ids:
+                    n += 1
+                used_ids.add(f"s{n}")
+                slides.append(new_slide.model_copy(update={"slide_id": f"s{n}"}))
+    return DeckSpec(deck_title=deck.deck_title, slides=slides)
+
+def _fit_outline(outline: DeckOutline, total_slides: int) -> DeckOutline:
+    """Merges neighbouring sections when there are more sections than slides, so each gets at least one."""
+    sections = outline.sections
+    if len(sections) <= total_slides:
+        return outline
+    groups = [sections[i * len(sections) // total_slides:(i + 1) * len(sections) // total_slides] for i in range(total_slides)]
+    merged = [
+        SectionPlan(
+            title=" / ".join(s.title for s in group),
+            summary=" ".join(s.summary for s in group),
+            slide_count=sum(s.slide_count for s in group),
+            source_start=min((s.source_start for s in group if s.source_start > 0), default=0),
+            source_end=max(s.source_end for s in group),
+        )
+        for group in groups
+    ]
+    return DeckOutline(deck_title=outline.deck_title, sections=merged)
+
+def _allocate_chunks(outline: DeckOutline, total_slides: int, chunk_size: int) -> List[Dict]:
+    """
+    Scales the planned section sizes to add up to total_slides, then splits any section
+    larger than chunk_size into consecutive parts. Pass an outline already fitted with
+    _fit_outline so section_idx matches its sections.
+    """
+    if not outline.sections:
+        raise ValueError("Section planner returned no sections.")
+    sections = _fit_outline(outline, total_slides).sections
+
+    # Largest-remainder rescale, keeping at least one slide per section
+    requested = [max(1, s.slide_count) for s in sections]
+    scale = total_slides / sum(requested)
+    raw = [r * scale for r in requested]
+    counts = [max(1, int(x)) for x in raw]
+    by_remainder = sorted(range(len(raw)), key=lambda i: raw[i] - int(raw[i]), reverse=True)
+    for i in by_remainder[:max(0, total_slides - sum(counts))]:
+        counts[i] += 1
+    # The one-slide minimum can overshoot; take the excess back from the largest sections
+    while sum(counts) > total_slides:
+        counts[counts.index(max(counts))] -= 1
+
+    chunks = []
+    for section_idx, (section, count) in enumerate(zip(sections, counts)):
+        parts = -(-count // chunk_size)
+        base, extra = divmod(count, parts)
+        for part in range(parts):
+            chunks.append({
+                "section_idx": section_idx,
+                "title": section.title,
+                "summary": section.summary,
+                "source_start": section.source_start,
+                "source_end": section.source_end,
+                "part": part + 1,
+                "parts": parts,
+                "slide_count": base + (1 if part < extra else 0),
+            })
+    return chunks
+
+def _chunk_prompt(prompt: str, outline: DeckOutline, chunk: Dict, chunk_no: int, total_chunks: int) -> str:
+    """
+    Builds a chunk prompt of bounded size: the head of the user's prompt, the source lines the
+    section planner cited for this section, and only neighbouring section titles.
+    """
+    sections = outline.sections
+    idx = chunk["section_idx"]
+    lines = [
+        f"You are writing part {chunk_no} of {total_chunks} of a larger presentation titled '{outline.deck_title}'.",
+        f"Overall Topic/Instructions:\n{truncate_to_tokens(prompt, CHUNK_TOPIC_TOKENS)}",
+        "",
+    ]
+    source = line_range(prompt, chunk["source_start"], chunk["source_end"])
+    # Short prompts are already included in full above
+    if source and count_tokens(prompt) > CHUNK_TOPIC_TOKENS:
+        lines.extend([f"Source material for this section:\n{truncate_to_tokens(source, CHUNK_SOURCE_TOKENS)}", ""])
+    if idx > 0:
+        lines.append(f"Previous section: {sections[idx - 1].title}")
+    section_label = f"'{chunk['title']}'"
+    if chunk["parts"] > 1:
+        section_label += f" (part {chunk['part']} of {chunk['parts']})"
+    lines.append(f"THIS PART covers section {section_label}: {chunk['summary']}")
+    if idx + 1 < len(sections):
+        lines.append(f"Next section: {sections[idx + 1].title}")
+    lines.append("")
+    if chunk_no == 1:
+        lines.append("This is the start of the deck, so open with a title slide.")
+    else:
+        lines.append("Only write the slides for this part. Do NOT add a title slide, agenda or closing slide.")
+    return "\n".join(lines)
+
+def _check_chunk(profile: TemplateProfile, deck: DeckSpec):
+    """Raises if a chunk could not be appended to the deck (e.g. a layout the template doesn't allow)."""
+    if not deck.slides:
+        raise ValueError("chunk has no slides")
+    allowed = set(profile.allowed_layout_ids) or {l.layout_id for l in profile.layouts}
+    bad = [s.slide_id for s in deck.slides if s.layout_id not in allowed]
+    if bad:
+        raise ValueError(f"slides {bad} use layouts outside the allowed ids {sorted(allowed)}")
+
+def generate_deck_chunked(
+    profile: TemplateProfile,
+    prompt: str,
+    slide_count: int,
+    tone: str,
+    template_path: str,
+    chunk_size: int = CHUNK_SIZE,
+    on_chunk: Optional[Callable[[int, int, DeckSpec], None]] = None,
+    images: Optional[Dict[str, str]] = None,
+) -> DeckSpec:
+    """
+    Hierarchical generation for very large decks: plans the section structure first, then runs
+    the regular agent graph once per chunk of at most chunk_size slides. Each chunk is validated
+    and retried on its own, so prompt size and per-call latency stay flat as the deck grows.
+    on_chunk(chunk_no, total_chunks, chunk_deck) is called as each chunk completes, e.g. to
+    append it to a ProgressiveRenderer.
+
+    Identical in-flight requests share the section plan and each chunk, but not the loop: every
+    caller collects the chunks and runs its own on_chunk in its own thread, so a UI callback that
+    raises (e.g. a session rerun) only ever affects that caller.
+    """
+    plan_key = input_hash("plan_sections", prompt, slide_count, tone)
+    outline = coordinator.generations.do(
+        plan_key, lambda: _fit_outline(plan_sections(prompt, slide_count, tone), slide_count)
+    )
+    chunks = _allocate_chunks(outline, slide_count, chunk_size)
+    logger.info("chunked generation: %d slides in %d sections, %d chunks", slide_count, len(outline.sections), len(chunks))
+
+    slides = []
+    for chunk_no, chunk in enumerate(chunks, start=1):
+        chunk_prompt = _chunk_prompt(prompt, outline, chunk, chunk_no, len(chunks))
+        key = _request_key("chunk", profile, template_path, chunk_prompt, chunk["slide_count"], tone, images or {})
+        chunk_deck = coordinator.generations.do(
+            key, lambda: _generate_chunk(profile, chunk_prompt, chunk, chunk_no, len(chunks), tone, template_path, images)
+        ).model_copy(deep=True)
+
+        # Slide ids are only unique within a chunk, so renumber them deck-wide
+        for slide in chunk_deck.slides:
+            slide.slide_id = f"s{len(slides) + 1}"
+            slides.append(slide)
+        if on_chunk:
+            on_chunk(chunk_no, len(chunks), chunk_deck)
+
+    return DeckSpec(deck_title=outline.deck_title, slides=slides)
+
+def _generate_chunk(profile, chunk_prompt, chunk, chunk_no, total_chunks, tone, template_path, images) -> DeckSpec:
+    for attempt in range(CHUNK_MAX_RETRIES + 1):
+        try:
+            chunk_deck = _generate_deck(profile, chunk_prompt, str(chunk["slide_count"]), tone, template_path, images)
+            # The graph can hand back a draft that failed visual validation; it must still render
+            _check_chunk(profile, chunk_deck)
+            return chunk_deck
+        except Exception as e:
+            if attempt >= CHUNK_MAX_RETRIES:
+                raise ValueError(f"Chunk {chunk_no}/{total_chunks} ('{chunk['title']}') failed: {e}") from e
+            logger.warning("chunk %d/%d failed (%s), retrying", chunk_no, total_chunks, e)
@@ -0,0 +1,215 @@
+import os
+import time
+import random
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Callable, Dict, Optional, Type
+
+from pydantic import BaseModel
+
+from core.coordinator import coordinator
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "gpt-4o-2024-08-06"
+FAST_MODEL = "gpt-4o-mini"
+
+
+class NodeConfig(BaseModel):
+    model: str = DEFAULT_MODEL
+    # Wall-clock limit for a single attempt, in seconds
+    timeout: float = 60.0
+    max_retries: int = 2
+    backoff_base: float = 1.0
+    backoff_max: float = 20.0
+    # Send a second, identical request if the first is slower than the node's p95 latency
+    hedge: bool = False
+    hedge_min_delay: float = 2.0
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    val = os.environ.get(name)
+    if val is None:
+        return default
+    return val.strip().lower() in ("1", "true", "yes", "on")
+
+
+# Per-node defaults: planning is plain text and tolerates a cheaper, faster model
+NODE_DEFAULTS: Dict[str, NodeConfig] = {
+    "planner": NodeConfig(model=FAST_MODEL, timeout=60.0),
+    "section_planner": NodeConfig(model=FAST_MODEL, timeout=60.0),
+    "writer": NodeConfig(model=DEFAULT_MODEL, timeout=120.0),
+    "visual_validator": NodeConfig(model=DEFAULT_MODEL, timeout=60.0, max_retries=1),
+}
+
+
+def get_node_config(node: str) -> NodeConfig:
+    """
+    Resolves a node's config from NODE_DEFAULTS, overridden by environment variables:
+    PPTLLM_<NODE>_MODEL, PPTLLM_<NODE>_TIMEOUT, PPTLLM_<NODE>_MAX_RETRIES and PPTLLM_<NODE>_HEDGE.
+    PPTLLM_LLM_HEDGE turns hedging on for every node that does not set it explicitly.
+    """
+    base = NODE_DEFAULTS.get(node, NodeConfig())
+    prefix = f"PPTLLM_{node.upper()}_"
+    overrides: Dict[str, Any] = {}
+    if os.environ.get(prefix + "MODEL"):
+        overrides["model"] = os.environ[prefix + "MODEL"]
+    if os.environ.get(prefix + "TIMEOUT"):
+        overrides["timeout"] = float(os.environ[prefix + "TIMEOUT"])
+    if os.environ.get(prefix + "MAX_RETRIES"):
+        overrides["max_retries"] = int(os.environ[prefix + "MAX_RETRIES"])
+    overrides["hedge"] = _env_bool(prefix + "HEDGE", _env_bool("PPTLLM_LLM_HEDGE", base.hedge))
+    return base.model_copy(update=overrides)
+
+
+# --- Model construction ---
+
+def _default_llm_factory(config: NodeConfig):
+    from langchain_openai import ChatOpenAI
+
+    api_key = os.environ.get("OPENAI_API_KEY", "").strip(' \t\n\r"“”\'')
+    # Retries are handled by call_llm so that backoff and hedging share one policy
+    kwargs = {"model": config.model, "timeout": config.timeout, "max_retries": 0}
+    if api_key:
+        kwargs["api_key"] = api_key
+    return ChatOpenAI(**kwargs)
+
+
+_llm_factory: Callable[[NodeConfig], Any] = _default_llm_factory
+_llm_cache: Dict[tuple, Any] = {}
+_llm_cache_lock = threading.Lock()
+
+
+def set_llm_factory(factory: Optional[Callable[[NodeConfig], Any]]):
+    """Replaces how chat models are built (e.g. with a local stub in tests). None restores the default."""
+    global _llm_factory
+    with _llm_cache_lock:
+        _llm_factory = factory or _default_llm_factory
+        _llm_cache.clear()
+
+
+def get_llm(node: str, schema: Optional[Type[BaseModel]] = None):
+    """Returns the (cached) chat model for a node, bound to a structured output schema if given."""
+    config = get_node_config(node)
+    key = (config.model, config.timeout, schema)
+    with _llm_cache_lock:
+        if key not in _llm_cache:
+            llm = _llm_factory(config)
+            _llm_cache[key] = llm.with_structured_output(schema) if schema is not None else llm
+        return _llm_cache[key]
+
+
+# --- Latency tracking ---
+
+class LatencyTracker:
+    """Keeps a rolling window of successful call latencies per node to derive hedge delays."""
+
+    def __init__(self, window: int = 100, min_samples: int = 10):
+        self.window = window
+        self.min_samples = min_samples
+        self._samples: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def record(self, node: str, latency_s: float):
+        with self._lock:
+            self._samples.setdefault(node, deque(maxlen=self.window)).append(latency_s)
+
+    def percentile(self, node: str, pct: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples.get(node, ()))
+        if len(samples) < self.min_samples:
+            return None
+        idx = min(len(samples) - 1, int(round(pct / 100.0 * (len(samples) - 1))))
+        return samples[idx]
+
+
+latency_tracker = LatencyTracker()
+
+# Attempts run on worker threads so a hung call can be abandoned at its timeout
+# Every running call holds an LLM admission slot, so this many workers never leaves one queued
+_executor = ThreadPoolExecutor(max_workers=coordinator.llm.limit, thread_name_prefix="llm-call")
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Exponential backoff with full jitter: uniform in [0, min(cap, base * 2**attempt)]."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def _hedge_delay(node: str, config: NodeConfig) -> Optional[float]:
+    if not config.hedge:
+        return None
+    p95 = latency_tracker.percentile(node, 95)
+    if p95 is None:
+        return None
+    return max(config.hedge_min_delay, p95)
+
+
+def _submit(gate, runnable, messages: list):
+    """Starts a call on a gate slot the caller already holds; the slot is freed only when the call really ends."""
+    try:
+        future = _executor.submit(runnable.invoke, messages)
+    except BaseException:
+        gate.release()
+        raise
+    future.add_done_callback(lambda _: gate.release())
+    return future
+
+
+def _attempt(node: str, runnable, messages: list, config: NodeConfig):
+    """Runs one attempt, with an optional hedged duplicate, bounded by the node timeout."""
+    gate = coordinator.llm
+    gate.acquire()
+    start = time.perf_counter()
+    futures = [_submit(gate, runnable, messages)]
+    deadline = start + config.timeout
+
+    hedge_after = _hedge_delay(node, config)
+    if hedge_after is not None and hedge_after < config.timeout:
+        done, _ = wait(futures, timeout=hedge_after)
+        if not done:
+            # The hedge needs a slot of its own; skip it rather than exceed the cap
+            if gate.acquire(blocking=False) is None:
+                logger.info("llm node=%s not hedging, no free LLM slot", node)
+            else:
+                logger.info("llm node=%s hedging after %.2fs", node, hedge_after)
+                futures.append(_submit(gate, runnable, messages))
+
+    pending = set(futures)
+    last_error: Optional[BaseException] = None
+    while pending:
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            break
+        done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                latency_tracker.record(node, time.perf_counter() - start)
+                return future.result()
+            last_error = future.exception()
+
+    if last_error is not None and not pending:
+        raise last_error
+    raise TimeoutError(f"LLM call for node '{node}' timed out after {config.timeout:.0f}s")
+
+
+def call_llm(node: str, messages: list, schema: Optional[Type[BaseModel]] = None):
+    """
+    Invokes the node's model with its timeout, retrying failures with exponential backoff
+    and jitter. Every in-flight request, including a hedged duplicate and a timed-out call
+    that is still running, holds one process-wide LLM admission slot, so at most
+    PPTLLM_MAX_CONCURRENT_LLM requests are ever outstanding. Raises the last error once
+    retries are exhausted.
+    """
+    config = get_node_config(node)
+    runnable = get_llm(node, schema)
+    for attempt in range(config.max_retries + 1):
+        try:
+            return _attempt(node, runnable, messages, config)
+        except Exception as e:
+            if attempt >= config.max_retries:
+                raise
+            delay = backoff_delay(attempt, config.backoff_base, config.backoff_max)
+            logger.warning("llm node=%s attempt %d failed (%s), retrying in %.2fs", node, attempt + 1, e, delay)
+            time.sleep(delay)
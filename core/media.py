@@ -0,0 +1,134 @@
+import io
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image
+
+from core.artifact_store import store
+from core.coordinator import file_digest
+
+# Images larger than this (longest side, in px) are downscaled before they go into a deck
+IMAGE_MAX_PX = int(os.environ.get("PPTLLM_IMAGE_MAX_PX", "1920"))
+IMAGE_CACHE_BYTES = int(float(os.environ.get("PPTLLM_IMAGE_CACHE_MB", "128")) * 1024 * 1024)
+# Directories image references may point into, besides the artifact store (os.pathsep-separated).
+# Empty by default: refs come from LLM output, so arbitrary server paths must not be readable.
+IMAGE_DIRS = [d for d in os.environ.get("PPTLLM_IMAGE_DIRS", "").split(os.pathsep) if d]
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif", ".bmp")
+# At most this many allow-listed images are offered to the writer (each one costs prompt tokens)
+MAX_LISTED_IMAGES = 50
+
+
+class ImageCache:
+    """
+    Process-wide LRU of prepared (decoded, resized, re-encoded) image bytes, shared by every render.
+    Entries are keyed by source content and target size, so a logo reused across slides and decks
+    is decoded once and always yields byte-identical output for package-level deduplication.
+    """
+
+    def __init__(self, max_bytes: int = IMAGE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple[str, int], Tuple[str, bytes]]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, entry):
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = entry
+            self._size += len(entry[1])
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                _, (_, data) = self._entries.popitem(last=False)
+                self._size -= len(data)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._size, "hits": self.hits, "misses": self.misses}
+
+
+image_cache = ImageCache()
+
+
+def resolve_image_path(ref: str, allowed_dirs: Optional[List[str]] = None) -> str:
+    """
+    An image reference is an artifact store id, or a file path inside one of the allowed
+    directories (PPTLLM_IMAGE_DIRS). Anything else is rejected with FileNotFoundError.
+    """
+    if store.exists(ref):
+        return store.path(ref)
+    real = os.path.realpath(ref)
+    for directory in IMAGE_DIRS if allowed_dirs is None else allowed_dirs:
+        root = os.path.realpath(directory)
+        if os.path.commonpath([root, real]) == root and os.path.isfile(real):
+            return real
+    raise FileNotFoundError(f"Image not found or not in an allowed directory: {ref}")
+
+
+def list_allowed_images(allowed_dirs: Optional[List[str]] = None, limit: int = MAX_LISTED_IMAGES) -> Dict[str, str]:
+    """Image files under the allowed directories, as {path reference: file name}, in a stable order."""
+    images = {}
+    for directory in IMAGE_DIRS if allowed_dirs is None else allowed_dirs:
+        for root, dirs, files in os.walk(os.path.realpath(directory)):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    images[os.path.join(root, name)] = name
+                    if len(images) >= limit:
+                        return images
+    return images
+
+
+def store_image(data: bytes, name: str) -> str:
+    """Stores an uploaded image in the artifact store and returns its id; raises ValueError if it isn't one."""
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image.verify()
+    except Exception as e:
+        raise ValueError(f"'{name}' is not a readable image: {e}") from e
+    return store.put_bytes(data, suffix=os.path.splitext(name)[1].lower(), kind="image")
+
+
+def _prepare(path: str, max_px: int) -> bytes:
+    with open(path, "rb") as f:
+        data = f.read()
+    # Raises PIL.UnidentifiedImageError (an OSError) for anything that is not a decodable image
+    with Image.open(io.BytesIO(data)) as image:
+        image.verify()
+    with Image.open(io.BytesIO(data)) as image:
+        if max(image.size) <= max_px:
+            # Small enough: keep the original bytes untouched
+            return data
+        fmt = image.format if image.format in ("PNG", "JPEG") else "PNG"
+        image.thumbnail((max_px, max_px))
+        if fmt == "JPEG" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        buf = io.BytesIO()
+        image.save(buf, fmt, **({"quality": 90, "optimize": True} if fmt == "JPEG" else {"optimize": True}))
+        return buf.getvalue()
+
+
+def load_image(ref: str, max_px: int = IMAGE_MAX_PX) -> Tuple[str, bytes]:
+    """Returns (sha256 of the prepared bytes, prepared bytes) for an image reference, via the shared cache."""
+    path = resolve_image_path(ref)
+    key = (file_digest(path), max_px)
+    entry = image_cache.get(key)
+    if entry is None:
+        data = _prepare(path, max_px)
+        entry = (hashlib.sha256(data).hexdigest(), data)
+        image_cache.put(key, entry)
+    return entry
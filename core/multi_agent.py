@@ -1,14 +1,25 @@
-import os
 import json
+import time
 from typing import List, Dict, Any, Optional
 from pydantic import BaseModel, Field
 from typing_extensions import TypedDict
 
 from langchain_core.messages import SystemMessage, HumanMessage
-from langchain_openai import ChatOpenAI
 from langgraph.graph import StateGraph, END
 
-from core.schemas import TemplateProfile, DeckSpec
+from core.schemas import TemplateProfile, DeckSpec, DeckOutline
+from core.llm_runtime import call_llm
+from core.prompt_budget import (
+    PROMPT_TOKEN_BUDGET,
+    FEEDBACK_TOKEN_BUDGET,
+    count_tokens,
+    count_message_tokens,
+    truncate_to_tokens,
+    summarize_outline,
+    compact_feedback,
+    number_lines,
+    record_prompt,
+)
 
 # --- State ---
 class AgentState(TypedDict):
@@ -17,6 +28,10 @@ class AgentState(TypedDict):
     slide_count: str
     tone: str
     template_path: str
+    # Images the writer may place in picture fields: {image reference: label (e.g. file name)}
+    available_images: Dict[str, str]
+    # Tokens already saved by compacting the prompt before it entered the graph (e.g. edits)
+    prompt_tokens_saved: int
     
     # Internal variables passed between agents
     layouts_context: str
@@ -28,58 +43,102 @@ class AgentState(TypedDict):
     review_passed: bool
     iterations: int
 
-# Initialize LLM
-# Note: We configure it identically to the single-agent but pass it natively
-api_key = os.environ.get("OPENAI_API_KEY", "").strip(' \t\n\r"“”\'')
-llm = ChatOpenAI(model="gpt-4o-2024-08-06", api_key=api_key) if api_key else ChatOpenAI(model="gpt-4o-2024-08-06")
+# LLMs are built lazily per node (model tier, timeout, retries, hedging) by core.llm_runtime
+
+def _invoke_llm(node: str, messages: list, tokens_saved: int = 0, schema=None):
+    """Invokes the node's model while recording prompt tokens, compaction savings and latency."""
+    prompt_tokens = count_message_tokens(messages)
+    start = time.perf_counter()
+    try:
+        return call_llm(node, messages, schema)
+    finally:
+        record_prompt(node, prompt_tokens, tokens_saved, time.perf_counter() - start)
 
 # --- Nodes (Agents) ---
 
 def context_builder(state: AgentState) -> AgentState:
     """Extracts formatting string summarizing allowed layouts."""
     profile = state["profile"]
+    images = state.get("available_images") or {}
     layouts_summary = []
     for layout in profile.layouts:
         if layout.layout_id in profile.allowed_layout_ids:
-            allowed_keys = [p.key for p in layout.placeholders]
+            # Picture fields are only offered when there are real images to put in them
+            allowed_keys = [p.key for p in layout.placeholders if images or not p.type.startswith("PICTURE")]
             layouts_summary.append(f"- Layout ID: {layout.layout_id}, Name: '{layout.layout_name}', Allowed Fields: {allowed_keys}")
     
+    if images:
+        layouts_summary.append(
+            "\nAvailable images (fill picture fields with {\"image\": \"<id>\"} using ONLY these ids):\n"
+            + "\n".join(f"- {ref}: {label}" for ref, label in images.items())
+        )
     return {"layouts_context": "\n".join(layouts_summary)}
 
 def planner_agent(state: AgentState) -> AgentState:
     """Agent 1: Designs a detailed slide-by-slide narrative outline without worrying about JSON mapping yet."""
     sys_msg = SystemMessage(content="You are a Master Presentation Strategist. Design a compelling narrative outline for a presentation.")
-    user_msg = HumanMessage(content=(
-        f"Topic/Instructions: {state['prompt']}\n"
-        f"Target Slide Count: {state['slide_count']}\n"
+    header = "Topic/Instructions: "
+    footer = (
+        f"\nTarget Slide Count: {state['slide_count']}\n"
         f"Audience/Tone: {state['tone']}\n\n"
         f"Provide a comprehensive outline. For each slide, define the Title, the core message, and specific bullet points or talking data."
-    ))
+    )
+    
+    # Keep very long pasted instructions within budget (edit prompts are already fitted, instruction first)
+    prompt_budget = PROMPT_TOKEN_BUDGET - count_message_tokens([sys_msg, header + footer])
+    prompt = truncate_to_tokens(state["prompt"], prompt_budget)
+    tokens_saved = state.get("prompt_tokens_saved", 0) + count_tokens(state["prompt"]) - count_tokens(prompt)
+    user_msg = HumanMessage(content=header + prompt + footer)
     
     # Standard text completion
-    response = llm.invoke([sys_msg, user_msg])
+    response = _invoke_llm("planner", [sys_msg, user_msg], tokens_saved)
     return {"planned_outline": response.content}
 
+def plan_sections(prompt: str, slide_count: int, tone: str) -> DeckOutline:
+    """Agent 0 (chunked mode): Splits a very large deck into sections that can be generated independently."""
+    sys_msg = SystemMessage(content="You are a Master Presentation Strategist. Structure a long presentation into coherent sections.")
+    header = "Topic/Instructions (lines are numbered):\n"
+    footer = (
+        f"\nTotal Slide Count: {slide_count}\n"
+        f"Audience/Tone: {tone}\n\n"
+        f"Split the presentation into sections. For each section give a title, a short summary of what it must cover, "
+        f"and its slide count. The section slide counts must add up to the total slide count. "
+        f"Also give source_start and source_end: the first and last line numbers of the instructions that the "
+        f"section draws its material from (0 and 0 if it draws on none)."
+    )
+    prompt_budget = PROMPT_TOKEN_BUDGET - count_message_tokens([sys_msg, header + footer])
+    numbered = number_lines(prompt, prompt_budget)
+    user_msg = HumanMessage(content=header + numbered + footer)
+    return _invoke_llm("section_planner", [sys_msg, user_msg], max(0, count_tokens(prompt) - count_tokens(numbered)), schema=DeckOutline)
+
 def writer_agent(state: AgentState) -> AgentState:
     """Agent 2: Maps the narrative outline to the exact JSON schema and allowed PPT Layouts."""
     
-    # Let's bind the LLM to strictly output our DeckSpec Pydantic schema
-    structured_llm = llm.with_structured_output(DeckSpec)
-    
     sys_msg = SystemMessage(content="You are an expert PowerPoint Deck Builder. You must map the provided presentation outline into the exact structured JSON format required by the corporate template.")
     
+    retry_note = ""
+    if state.get("iterations", 0) > 0 and not state.get("review_passed", True):
+        feedback = compact_feedback(state["review_feedback"], FEEDBACK_TOKEN_BUDGET)
+        retry_note = f"CRITICAL: The previous generation failed validation with this error:\n{feedback}\n\nPlease fix these errors and regenerate."
+    
+    # Whatever the layouts and retry note leave over goes to the outline
+    context = f"Template Layouts Context:\n{state['layouts_context']}\n\n"
+    outline_budget = PROMPT_TOKEN_BUDGET - count_message_tokens([sys_msg, context + retry_note]) - 16
+    outline = summarize_outline(state["planned_outline"], outline_budget)
+    
     content = (
-        f"Template Layouts Context:\n{state['layouts_context']}\n\n"
-        f"Presentation Outline (from Strategist):\n{state['planned_outline']}\n\n"
+        f"{context}"
+        f"Presentation Outline (from Strategist):\n{outline}\n\n"
+        f"{retry_note}"
+    )
+    tokens_saved = (count_tokens(state["planned_outline"]) - count_tokens(outline)) + (
+        count_tokens(state["review_feedback"]) - count_tokens(feedback) if retry_note else 0
     )
-    
-    if state.get("iterations", 0) > 0 and not state.get("review_passed", True):
-        content += f"CRITICAL: The previous generation failed validation with this error:\n{state['review_feedback']}\n\nPlease fix these errors and regenerate."
         
     user_msg = HumanMessage(content=content)
     
     try:
-        deck_spec = structured_llm.invoke([sys_msg, user_msg])
+        deck_spec = _invoke_llm("writer", [sys_msg, user_msg], tokens_saved, schema=DeckSpec)
         return {"draft_deck_spec": deck_spec}
     except Exception as e:
         return {"draft_deck_spec": None, "review_feedback": str(e), "review_passed": False}
@@ -100,9 +159,9 @@ def reviewer_agent(state: AgentState) -> AgentState:
         
     return {"review_passed": True, "review_feedback": "Passed semantic review. Proceeding to visual validation.", "iterations": iterations}
 
-import tempfile
 import base64
 from core.renderer import render_pptx, export_to_thumbnails
+from core.artifact_store import store
 
 def encode_image(image_path):
     with open(image_path, "rb") as image_file:
@@ -118,18 +177,18 @@ def visual_validator(state: AgentState) -> AgentState:
         
     iterations = state.get("iterations", 0) + 1
         
-    with tempfile.TemporaryDirectory() as temp_dir:
-        temp_pptx = os.path.join(temp_dir, "temp.pptx")
-        temp_img_dir = os.path.join(temp_dir, "images")
-        
-        # 1. Render temporary presentation
+    # 1. Render the draft presentation into the artifact store
+    with store.tmp_file(".pptx") as temp_pptx:
         try:
             render_pptx(template_path, deck, temp_pptx, state["profile"])
         except Exception as e:
             return {"review_passed": False, "review_feedback": f"Visual render failed: {str(e)}", "iterations": iterations}
-            
-        # 2. Export to images
-        images = export_to_thumbnails(temp_pptx, temp_img_dir)
+        pptx_id = store.put_file(temp_pptx, kind="pptx", move=True)
+    store.acquire(pptx_id)
+        
+    try:
+        # 2. Export to images (cached per rendered PPTX content)
+        images = export_to_thumbnails(store.path(pptx_id))
         if not images:
             return {"review_passed": True, "review_feedback": "Skipped Visual Validation (Failed to gen images).", "iterations": iterations}
             
@@ -149,7 +208,7 @@ def visual_validator(state: AgentState) -> AgentState:
         user_msg = HumanMessage(content=content)
         
         try:
-            response = llm.invoke([sys_msg, user_msg])
+            response = _invoke_llm("visual_validator", [sys_msg, user_msg])
             feedback = response.content.strip()
             
             if "PASS" in feedback.upper() and len(feedback) < 10:
@@ -159,6 +218,8 @@ def visual_validator(state: AgentState) -> AgentState:
                 
         except Exception as e:
             return {"review_passed": True, "review_feedback": f"Vision API error, skipping. ({str(e)})", "iterations": iterations}
+    finally:
+        store.release(pptx_id)
 
 # --- Routing ---
 def should_continue_reviewer(state: AgentState) -> str:
@@ -0,0 +1,161 @@
+import io
+import os
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from PIL import Image
+
+from core.schemas import DeckSpec, SlideSpec, TemplateProfile
+from core.coordinator import input_hash, file_digest
+from core.artifact_store import store
+from core.renderer import export_to_thumbnails
+
+logger = logging.getLogger(__name__)
+
+# Gallery thumbnails are downscaled so large decks stay light in the browser
+GALLERY_THUMB_WIDTH = int(os.environ.get("PPTLLM_GALLERY_THUMB_WIDTH", "320"))
+# In-memory index bounds (least recently used entries are dropped; the images live in the artifact store)
+GALLERY_MAX_VERSIONS = int(os.environ.get("PPTLLM_GALLERY_MAX_VERSIONS", "256"))
+GALLERY_MAX_SLIDES = int(os.environ.get("PPTLLM_GALLERY_MAX_SLIDES", "20000"))
+# Failed versions are retried after this long (e.g. soffice was busy or installed later)
+GALLERY_RETRY_S = float(os.environ.get("PPTLLM_GALLERY_RETRY_S", "60"))
+
+PENDING = "pending"
+READY = "ready"
+UNAVAILABLE = "unavailable"
+
+
+def slide_hash(render_context: str, slide: SlideSpec) -> str:
+    """Identifies how a single slide renders: same template, layouts and slide content give the same image."""
+    # slide_id is not rendered, so reordered or renumbered slides still hit the cache
+    return input_hash("slide", render_context, slide.model_dump(exclude={"slide_id"}))
+
+
+def render_context_key(template_path: str, profile: TemplateProfile) -> str:
+    return input_hash(file_digest(template_path), profile.model_dump(exclude={"template_name"}))
+
+
+def downscale_jpeg(path: str, width: int = GALLERY_THUMB_WIDTH) -> bytes:
+    with Image.open(path) as image:
+        if image.format == "JPEG" and image.width <= width:
+            # Already rasterised at thumbnail size: the stored bytes are reused as they are
+            with open(path, "rb") as f:
+                return f.read()
+        image = image.convert("RGB")
+        image.thumbnail((width, width * 4))
+        buf = io.BytesIO()
+        image.save(buf, "JPEG", quality=80, optimize=True)
+        return buf.getvalue()
+
+
+class ThumbnailGallery:
+    """
+    Builds downscaled per-slide thumbnails for rendered deck versions in the background.
+    Results are cached per version (the rendered PPTX artifact id) and per slide hash, so a
+    version whose slides were all seen before (e.g. switching back in history) needs no soffice run.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 2,
+        max_versions: int = GALLERY_MAX_VERSIONS,
+        max_slides: int = GALLERY_MAX_SLIDES,
+        retry_after_s: float = GALLERY_RETRY_S,
+    ):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="thumbnails")
+        self._lock = threading.Lock()
+        self.max_versions = max_versions
+        self.max_slides = max_slides
+        self.retry_after_s = retry_after_s
+        self._slides: "OrderedDict[str, str]" = OrderedDict()
+        self._versions: "OrderedDict[str, Dict]" = OrderedDict()
+
+    def request(self, pptx_id: str, deck: DeckSpec, template_path: str, profile: TemplateProfile):
+        """Schedules thumbnail generation for a rendered version; a no-op if already cached or queued."""
+        context = render_context_key(template_path, profile)
+        hashes = [slide_hash(context, s) for s in deck.slides]
+        with self._lock:
+            version = self._versions.get(pptx_id)
+            if version is not None:
+                self._versions.move_to_end(pptx_id)
+                if version["status"] == PENDING:
+                    return
+                if version["status"] == READY and self._all_cached(version["hashes"]):
+                    return
+                # Failed versions are retried after a cooldown; evicted ready ones are rebuilt
+                if version["status"] == UNAVAILABLE and time.monotonic() - version["built_at"] < self.retry_after_s:
+                    return
+            self._versions[pptx_id] = {"status": PENDING, "hashes": hashes}
+            self._trim(self._versions, self.max_versions)
+            if self._all_cached(hashes):
+                self._versions[pptx_id]["status"] = READY
+                return
+        # Keep the rendered PPTX alive until the background job has read it
+        store.acquire(pptx_id)
+        self._executor.submit(self._build, pptx_id, hashes)
+
+    @staticmethod
+    def _trim(entries: OrderedDict, limit: int):
+        while len(entries) > limit:
+            entries.popitem(last=False)
+
+    def _all_cached(self, hashes: List[str]) -> bool:
+        for h in hashes:
+            if h not in self._slides or not store.exists(self._slides[h]):
+                return False
+            self._slides.move_to_end(h)
+        return True
+
+    def _build(self, pptx_id: str, hashes: List[str]):
+        try:
+            images = export_to_thumbnails(store.path(pptx_id), width=GALLERY_THUMB_WIDTH) if store.exists(pptx_id) else []
+            # Slides already present in the template come first in the rendered file
+            offset = len(images) - len(hashes)
+            if not images or offset < 0:
+                raise RuntimeError(f"expected {len(hashes)} slide images, got {len(images)}")
+            thumbs = {}
+            for h, image_path in zip(hashes, images[offset:]):
+                thumbs[h] = store.put_bytes(downscale_jpeg(image_path), suffix=".jpg", kind="gallery")
+            status, error = READY, None
+        except Exception as e:
+            logger.warning("thumbnail gallery for %s unavailable: %s", pptx_id[:12], e)
+            thumbs = {}
+            status, error = UNAVAILABLE, str(e)
+        finally:
+            store.release(pptx_id)
+        with self._lock:
+            self._slides.update(thumbs)
+            self._trim(self._slides, self.max_slides)
+            version = self._versions.get(pptx_id)
+            # The version may have been dropped from the index while it was building
+            if version is not None:
+                version.update(status=status, error=error, built_at=time.monotonic())
+
+    def status(self, pptx_id: Optional[str]) -> Optional[str]:
+        with self._lock:
+            version = self._versions.get(pptx_id)
+            return version["status"] if version else None
+
+    def error(self, pptx_id: Optional[str]) -> Optional[str]:
+        """Why the last build of a version failed, if it did."""
+        with self._lock:
+            version = self._versions.get(pptx_id)
+            return version.get("error") if version else None
+
+    def thumbnails(self, pptx_id: str, start: int = 0, count: Optional[int] = None) -> List[Optional[str]]:
+        """Paths of the downscaled thumbnails for a slice of slides (None where one is missing)."""
+        with self._lock:
+            version = self._versions.get(pptx_id)
+            if version is None or version["status"] != READY:
+                return []
+            self._versions.move_to_end(pptx_id)
+            hashes = version["hashes"][start:None if count is None else start + count]
+            ids = [self._slides.get(h) for h in hashes]
+        return [store.path(i) if i and store.exists(i) else None for i in ids]
+
+
+gallery = ThumbnailGallery()
@@ -0,0 +1,216 @@
+import os
+import re
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+from core.schemas import DeckSpec, ImageRef
+
+logger = logging.getLogger(__name__)
+
+# Total token budget for a single assembled prompt (system + user messages).
+PROMPT_TOKEN_BUDGET = int(os.environ.get("PPTLLM_PROMPT_TOKEN_BUDGET", "12000"))
+# Upper bound on how much of a retry prompt the raw review feedback may take.
+FEEDBACK_TOKEN_BUDGET = int(os.environ.get("PPTLLM_FEEDBACK_TOKEN_BUDGET", "800"))
+
+# Tokens kept free for the planner's own system message and framing around an edit prompt
+PLANNER_RESERVE_TOKENS = 256
+
+TOKENIZER_MODEL = "gpt-4o"
+# Rough per-message framing overhead used by the chat completions API.
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_BULLET_RE = re.compile(r"^\s*(?:[-*•+]|\d+[.)])\s+")
+_SLIDE_REF_RE = re.compile(r"\bslides?\s*#?(\d+)(?:\s*(?:-|–|to)\s*(\d+))?")
+_TRUNCATION_MARKER = "\n[... truncated to fit token budget ...]"
+
+_encoding = None
+_encoding_loaded = False
+
+
+def _get_encoding():
+    """Loads the tiktoken encoding once; returns None if it is unavailable (e.g. offline pods)."""
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        try:
+            import tiktoken
+            _encoding = tiktoken.encoding_for_model(TOKENIZER_MODEL)
+        except Exception as e:
+            logger.info("tiktoken unavailable, falling back to character estimate (%s)", e)
+            _encoding = None
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    """Counts tokens in a string, using tiktoken when available and ~4 chars/token otherwise."""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(messages: List[Any]) -> int:
+    """Counts tokens across chat messages. Only text parts of multimodal content are counted."""
+    total = 0
+    for msg in messages:
+        content = getattr(msg, "content", msg)
+        if isinstance(content, list):
+            for part in content:
+                if isinstance(part, dict) and part.get("type") == "text":
+                    total += count_tokens(part.get("text", ""))
+        else:
+            total += count_tokens(str(content))
+        total += MESSAGE_OVERHEAD_TOKENS
+    return total
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Hard-truncates text to at most max_tokens, appending a marker if anything was cut."""
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+    budget = max(max_tokens - count_tokens(_TRUNCATION_MARKER), 0)
+    encoding = _get_encoding()
+    if encoding is None:
+        head = text[:budget * 4]
+    else:
+        head = encoding.decode(encoding.encode(text, disallowed_special=())[:budget])
+    return head.rstrip() + _TRUNCATION_MARKER
+
+
+# --- Compaction strategies ---
+
+def compact_deck_encoding(deck: DeckSpec) -> str:
+    """
+    Encodes a deck as compact, line-oriented text for LLM prompts.
+    Keeps slide ids, layout ids and every field value, but drops the JSON quoting and key
+    repetition of model_dump_json(), which roughly halves the token count on typical decks.
+    """
+    lines = [f"Deck Title: {deck.deck_title}"]
+    for slide in deck.slides:
+        lines.append(f"[{slide.slide_id}] layout={slide.layout_id}")
+        for field in slide.fields:
+            if isinstance(field.value, ImageRef):
+                lines.append(f'  {field.key}: {{"image": "{field.value.image}"}}')
+            elif isinstance(field.value, list):
+                lines.append(f"  {field.key}:")
+                lines.extend(f"    - {item}" for item in field.value)
+            else:
+                lines.append(f"  {field.key}: {field.value}")
+        if slide.notes:
+            lines.append(f"  notes: {slide.notes}")
+    return "\n".join(lines)
+
+
+def mentioned_slides(deck: DeckSpec, instruction: str) -> List[int]:
+    """Indexes of slides an edit instruction refers to, as "slide N", "slides N-M" or by slide id."""
+    text = instruction.lower()
+    mentioned = set()
+    for first, last in _SLIDE_REF_RE.findall(text):
+        mentioned.update(range(int(first) - 1, min(int(last or first), len(deck.slides))))
+    for i, slide in enumerate(deck.slides):
+        if re.search(rf"\b{re.escape(slide.slide_id.lower())}\b", text):
+            mentioned.add(i)
+    return sorted(i for i in mentioned if 0 <= i < len(deck.slides))
+
+
+def number_lines(text: str, max_tokens: int) -> str:
+    """
+    Prefixes every non-blank line with its 1-based line number ("12| ...") so a model can cite
+    line ranges. If that is too large only heading (non-bullet) lines are kept, then it is hard-truncated.
+    """
+    lines = [(n, line.rstrip()) for n, line in enumerate(text.splitlines(), start=1) if line.strip()]
+    numbered = "\n".join(f"{n}| {line}" for n, line in lines)
+    if count_tokens(numbered) <= max_tokens:
+        return numbered
+    headings = "\n".join(f"{n}| {line}" for n, line in lines if not _BULLET_RE.match(line))
+    return truncate_to_tokens(headings, max_tokens)
+
+
+def line_range(text: str, start: int, end: int) -> str:
+    """Lines start..end (1-based, inclusive) of text; empty for an empty or invalid range."""
+    if start < 1 or end < start:
+        return ""
+    return "\n".join(text.splitlines()[start - 1:end]).strip()
+
+
+def summarize_outline(outline: str, max_tokens: int) -> str:
+    """
+    Shrinks a planner outline to fit max_tokens.
+    Blank lines are dropped first, then each slide block keeps its heading lines and an
+    ever smaller number of bullets. As a last resort the outline is hard-truncated.
+    """
+    if count_tokens(outline) <= max_tokens:
+        return outline
+
+    lines = [line.rstrip() for line in outline.splitlines() if line.strip()]
+    condensed = "\n".join(lines)
+    if count_tokens(condensed) <= max_tokens:
+        return condensed
+
+    # Group into blocks: a heading (non-bullet line) followed by its bullets
+    blocks: List[List[str]] = []
+    for line in lines:
+        if not _BULLET_RE.match(line) or not blocks:
+            blocks.append([line])
+        else:
+            blocks[-1].append(line)
+
+    max_bullets = max((len(b) - 1 for b in blocks), default=0)
+    for keep in range(max_bullets - 1, -1, -1):
+        kept = []
+        for block in blocks:
+            kept.append(block[0])
+            kept.extend(block[1:1 + keep])
+        candidate = "\n".join(kept)
+        if count_tokens(candidate) <= max_tokens:
+            return candidate
+
+    return truncate_to_tokens(condensed, max_tokens)
+
+
+def compact_feedback(feedback: str, max_tokens: int = FEEDBACK_TOKEN_BUDGET) -> str:
+    """Deduplicates repeated feedback lines (e.g. identical validation errors) and caps its size."""
+    seen = set()
+    unique = []
+    for line in feedback.splitlines():
+        norm = " ".join(line.split()).lower()
+        if not norm or norm in seen:
+            continue
+        seen.add(norm)
+        unique.append(line.rstrip())
+    return truncate_to_tokens("\n".join(unique), max_tokens)
+
+
+# --- Metrics ---
+
+_metrics_lock = threading.Lock()
+_metrics: Dict[str, Dict[str, float]] = {}
+
+
+def record_prompt(node: str, prompt_tokens: int, tokens_saved: int = 0, latency_s: Optional[float] = None):
+    """Logs prompt size, compaction savings and call latency, and accumulates per-node totals."""
+    with _metrics_lock:
+        m = _metrics.setdefault(node, {"calls": 0, "prompt_tokens": 0, "tokens_saved": 0, "latency_s": 0.0})
+        m["calls"] += 1
+        m["prompt_tokens"] += prompt_tokens
+        m["tokens_saved"] += tokens_saved
+        if latency_s is not None:
+            m["latency_s"] += latency_s
+    logger.info(
+        "prompt node=%s tokens=%d saved=%d budget=%d latency=%s",
+        node, prompt_tokens, tokens_saved, PROMPT_TOKEN_BUDGET,
+        f"{latency_s:.2f}s" if latency_s is not None else "n/a",
+    )
+    if prompt_tokens > PROMPT_TOKEN_BUDGET:
+        logger.warning("prompt node=%s exceeds token budget (%d > %d)", node, prompt_tokens, PROMPT_TOKEN_BUDGET)
+
+
+def get_prompt_metrics() -> Dict[str, Dict[str, float]]:
+    """Returns a snapshot of the accumulated per-node prompt metrics."""
+    with _metrics_lock:
+        return {node: dict(m) for node, m in _metrics.items()}
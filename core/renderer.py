@@ -1,100 +1,170 @@
+import io
 from pptx import Presentation
-from core.schemas import DeckSpec, TemplateProfile
+from core.schemas import DeckSpec, TemplateProfile, ImageRef
+from core.media import load_image
 
 def render_pptx(template_path: str, deck_spec: DeckSpec, output_path: str, profile: TemplateProfile):
     """Renders the python-pptx presentation and saves it to output_path"""
-    prs = Presentation(template_path)
-    
-    # Build dictionary of shape mapping to make applying fields easy
-    # layout_id -> { field_key -> idx }
-    layout_map = {}
-    for layout in profile.layouts:
-        layout_map[layout.layout_id] = {p.key: p.idx for p in layout.placeholders}
-    
-    for slide_spec in deck_spec.slides:
-        layout_id = slide_spec.layout_id
-        if layout_id < 0 or layout_id >= len(prs.slide_layouts):
-            raise ValueError(f"Invalid layout_id: {layout_id}")
-            
-        layout = prs.slide_layouts[layout_id]
-        slide = prs.slides.add_slide(layout)
-        
-        ph_map = layout_map.get(layout_id, {})
+    renderer = ProgressiveRenderer(template_path, profile)
+    renderer.add_slides(deck_spec.slides)
+    renderer.save(output_path)
+
+class ProgressiveRenderer:
+    """Keeps a presentation open so slides can be appended chunk by chunk before saving once."""
+
+    def __init__(self, template_path: str, profile: TemplateProfile):
+        self.prs = Presentation(template_path)
+        # Slides already in the template are kept but not counted as rendered
+        self._template_slides = len(self.prs.slides)
         
-        for field in slide_spec.fields:
-            field_key = field.key
-            field_val = field.value
-            if field_key not in ph_map:
-                # MissingPlaceholderError analogue
-                print(f"Warning: Placeholder '{field_key}' not found in layout {layout_id}. Skipping.")
-                continue
+        # Build dictionary of shape mapping to make applying fields easy
+        # layout_id -> { field_key -> idx }
+        self.layout_map = {}
+        for layout in profile.layouts:
+            self.layout_map[layout.layout_id] = {p.key: p.idx for p in layout.placeholders}
+
+    @property
+    def slide_count(self) -> int:
+        """Number of slides added by this renderer (excluding the template's own slides)."""
+        return len(self.prs.slides) - self._template_slides
+
+    def add_slides(self, slides):
+        prs = self.prs
+        for slide_spec in slides:
+            layout_id = slide_spec.layout_id
+            if layout_id < 0 or layout_id >= len(prs.slide_layouts):
+                raise ValueError(f"Invalid layout_id: {layout_id}")
                 
-            idx = ph_map[field_key]
-            try:
-                shape = slide.placeholders[idx]
-            except KeyError:
-                print(f"Warning: Shape index {idx} not found in layout {layout_id}. Skipping.")
-                continue
+            layout = prs.slide_layouts[layout_id]
+            slide = prs.slides.add_slide(layout)
             
-            # Apply content
-            if isinstance(field_val, list):
-                # Body bullets
-                text_frame = shape.text_frame
-                text_frame.clear()  # removes all paragraphs
-                for i, bullet_text in enumerate(field_val):
-                    p = text_frame.paragraphs[0] if i == 0 else text_frame.add_paragraph()
-                    p.text = bullet_text
-                    p.level = 0
-            else:
-                # Standard text
-                shape.text_frame.text = str(field_val)
-                
-        # Notes
-        if slide_spec.notes:
-            notes_slide = slide.notes_slide
-            text_frame = notes_slide.notes_text_frame
-            text_frame.text = slide_spec.notes
+            ph_map = self.layout_map.get(layout_id, {})
             
-    prs.save(output_path)
+            for field in slide_spec.fields:
+                field_key = field.key
+                field_val = field.value
+                if field_key not in ph_map:
+                    # MissingPlaceholderError analogue
+                    print(f"Warning: Placeholder '{field_key}' not found in layout {layout_id}. Skipping.")
+                    continue
+                    
+                idx = ph_map[field_key]
+                try:
+                    shape = slide.placeholders[idx]
+                except KeyError:
+                    print(f"Warning: Shape index {idx} not found in layout {layout_id}. Skipping.")
+                    continue
+                
+                # Apply content
+                if isinstance(field_val, ImageRef):
+                    self._fill_picture(slide, shape, field_val, layout_id)
+                elif isinstance(field_val, list):
+                    # Body bullets
+                    text_frame = shape.text_frame
+                    text_frame.clear()  # removes all paragraphs
+                    for i, bullet_text in enumerate(field_val):
+                        p = text_frame.paragraphs[0] if i == 0 else text_frame.add_paragraph()
+                        p.text = bullet_text
+                        p.level = 0
+                else:
+                    # Standard text
+                    shape.text_frame.text = str(field_val)
+                    
+            # Notes
+            if slide_spec.notes:
+                notes_slide = slide.notes_slide
+                text_frame = notes_slide.notes_text_frame
+                text_frame.text = slide_spec.notes
+
+    def _fill_picture(self, slide, shape, image_ref: ImageRef, layout_id: int):
+        if not hasattr(shape, "insert_picture"):
+            print(f"Warning: Placeholder {shape.placeholder_format.idx} in layout {layout_id} is not a picture placeholder. Skipping.")
+            return
+        try:
+            _, data = load_image(image_ref.image)
+            # python-pptx stores identical image bytes once per package (matched by SHA1)
+            shape.insert_picture(io.BytesIO(data))
+        except Exception as e:
+            print(f"Warning: Could not load image '{image_ref.image}': {e}. Skipping.")
+
+    def save(self, output_path):
+        self.prs.save(output_path)
 
 import os
+import pathlib
 import subprocess
+from typing import List, Optional
 from pdf2image import convert_from_path
+from core.coordinator import coordinator, file_digest
+from core.artifact_store import store
 
-def export_to_thumbnails(pptx_path: str, output_dir: str):
+def export_to_thumbnails(pptx_path: str, width: Optional[int] = None) -> List[str]:
     """
     Converts a PPTX file to a series of JPEG thumbnails using LibreOffice and pdf2image.
+    With width set, pages are rasterised straight to that width (e.g. gallery thumbnails);
+    otherwise at 200 dpi. Pages are written to disk by poppler and moved into the store one
+    by one, so a large deck is never held in memory.
+    The PDF and thumbnails are kept in the artifact store, keyed by the PPTX content (and width),
+    so converting the same rendered deck again returns the stored thumbnail paths without soffice.
     """
-    os.makedirs(output_dir, exist_ok=True)
-    
-    # 1. Convert PPTX to PDF using LibreOffice headless
-    pdf_path = pptx_path.replace(".pptx", ".pdf")
+    source_digest = file_digest(pptx_path)
+    relation = "thumbnails" if width is None else f"thumbnails_w{width}"
+    cached = store.get_derived(source_digest, relation)
+    if cached is not None:
+        return [store.path(i) for i in cached]
+
+    with store.scratch_dir() as work_dir:
+        # 1. Convert PPTX to PDF using LibreOffice headless (once per PPTX, whatever the width)
+        pdf_ids = store.get_derived(source_digest, "pdf")
+        if pdf_ids is None:
+            pdf_id = _convert_to_pdf(pptx_path, work_dir)
+            if pdf_id is None:
+                return []
+        else:
+            pdf_id = pdf_ids[0]
+
+        # 2. Convert PDF to Images
+        store.acquire(pdf_id)
+        try:
+            image_paths = convert_from_path(
+                store.path(pdf_id),
+                output_folder=work_dir,
+                fmt="jpeg",
+                paths_only=True,
+                size=(width, None) if width else None,
+            )
+        finally:
+            store.release(pdf_id)
+        thumbnail_ids = [store.put_file(path, kind="thumbnail", move=True) for path in image_paths]
+
+    store.set_derived(source_digest, "pdf", [pdf_id])
+    store.set_derived(source_digest, relation, thumbnail_ids)
+    return [store.path(i) for i in thumbnail_ids]
+
+def _convert_to_pdf(pptx_path: str, work_dir: str) -> Optional[str]:
+    """Runs soffice on the PPTX and returns the stored PDF's artifact id, or None if it failed."""
+    pdf_path = os.path.join(work_dir, os.path.splitext(os.path.basename(pptx_path))[0] + ".pdf")
     try:
         # Mac OS path for LibreOffice or using 'soffice' if linked
-        subprocess.run(
-            ["soffice", "--headless", "--convert-to", "pdf", "--outdir", os.path.dirname(os.path.abspath(pptx_path)), pptx_path],
-            check=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
-        )
+        # soffice is CPU-heavy, so conversions share a process-wide concurrency cap.
+        # Each run gets its own user profile: concurrent instances sharing one can fail to convert.
+        profile_uri = pathlib.Path(work_dir, "profile").as_uri()
+        with coordinator.soffice.slot():
+            subprocess.run(
+                ["soffice", f"-env:UserInstallation={profile_uri}", "--headless",
+                 "--convert-to", "pdf", "--outdir", work_dir, pptx_path],
+                check=True,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE
+            )
     except subprocess.CalledProcessError as e:
         print(f"LibreOffice conversion failed: {e.stderr.decode()}")
-        return []
+        return None
     except FileNotFoundError:
         print("LibreOffice (soffice) not found on path.")
-        return []
+        return None
 
-    # 2. Convert PDF to Images
     if not os.path.exists(pdf_path):
         print("PDF was not created.")
-        return []
-        
-    images = convert_from_path(pdf_path)
-    output_files = []
-    
-    for i, image in enumerate(images):
-        out_path = os.path.join(output_dir, f"slide_{i+1}.jpg")
-        image.save(out_path, "JPEG")
-        output_files.append(out_path)
-        
-    return output_files
+        return None
+    return store.put_file(pdf_path, kind="pdf", move=True)
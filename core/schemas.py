@@ -16,9 +16,13 @@ class TemplateProfile(BaseModel):
     layouts: List[LayoutInfo]
     allowed_layout_ids: List[int] = Field(default_factory=list)
 
+class ImageRef(BaseModel):
+    # Artifact store id or local file path of the image
+    image: str
+
 class SlideField(BaseModel):
     key: str
-    value: Union[str, List[str]]
+    value: Union[str, List[str], ImageRef]
 
 class SlideSpec(BaseModel):
     slide_id: str
@@ -30,3 +34,15 @@ class DeckSpec(BaseModel):
     deck_title: str
     slides: List[SlideSpec]
 
+
+class SectionPlan(BaseModel):
+    title: str
+    summary: str
+    slide_count: int
+    # 1-based, inclusive line range of the user's prompt this section draws on (0 = none)
+    source_start: int = 0
+    source_end: int = 0
+
+class DeckOutline(BaseModel):
+    deck_title: str
+    sections: List[SectionPlan]
@@ -16,6 +16,8 @@ def profile_template(template_path: str, template_name: str) -> TemplateProfile:
                 key = "title"
             elif "subtitle" in name:
                 key = "subtitle"
+            elif "picture" in name:
+                key = "image"
             elif "body" in name or "content" in name or "text" in name:
                 key = "body"
             elif "footer" in name:
@@ -1,13 +1,13 @@
 import os
-import tempfile
+from core.artifact_store import store
 
 def save_uploaded_file(uploaded_file) -> str:
-    """Save Streamlit uploaded file to a temporary file, return the path."""
-    # We use NamedTemporaryFile to ensure PPTX can read it from a path
+    """Save Streamlit uploaded file into the artifact store, return the path."""
+    # Content-addressed, so re-uploads of the same template share one file on disk.
+    # Callers pin it with store.acquire(store.id_for_path(path)) for as long as they use it.
     try:
         suffix = os.path.splitext(uploaded_file.name)[1]
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-            tmp.write(uploaded_file.getvalue())
-            return tmp.name
+        artifact_id = store.put_bytes(uploaded_file.getvalue(), suffix=suffix, kind="template")
+        return store.path(artifact_id)
     except Exception as e:
         return ""
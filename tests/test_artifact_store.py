@@ -0,0 +1,77 @@
+import os
+import time
+import pytest
+
+from core.artifact_store import ArtifactStore
+
+def test_put_dedupes_by_content(tmp_path):
+    store = ArtifactStore(root=str(tmp_path / "store"))
+    a = store.put_bytes(b"template", suffix=".pptx", kind="template")
+    b = store.put_bytes(b"template", suffix=".pptx", kind="template")
+    src = tmp_path / "copy.pptx"
+    src.write_bytes(b"template")
+    c = store.put_file(str(src), kind="template")
+    assert a == b == c
+    assert store.read_bytes(a) == b"template"
+    assert store.stats()["count"] == 1
+    assert store.id_for_path(store.path(a)) == a
+
+def test_gc_evicts_lru_over_size_but_keeps_pinned(tmp_path):
+    store = ArtifactStore(root=str(tmp_path / "store"), max_bytes=25)
+    first = store.put_bytes(b"a" * 10, kind="pptx")
+    store.acquire(first)
+    second = store.put_bytes(b"b" * 10, kind="pptx")
+    time.sleep(0.01)
+    third = store.put_bytes(b"c" * 10, kind="pptx")
+
+    assert store.exists(first)
+    assert not store.exists(second)
+    assert store.exists(third)
+    assert not os.path.exists(os.path.join(str(tmp_path / "store"), "pptx", second))
+
+    store.release(first)
+    store.max_bytes = 10
+    store.gc()
+    assert not store.exists(first)
+    assert store.stats()["total_bytes"] <= 10
+
+def test_gc_evicts_expired(tmp_path):
+    store = ArtifactStore(root=str(tmp_path / "store"), max_age_s=0.05)
+    old = store.put_bytes(b"old", kind="pdf")
+    pinned = store.put_bytes(b"pinned", kind="pdf")
+    store.acquire(pinned)
+    time.sleep(0.1)
+    assert store.gc() == 1
+    assert not store.exists(old)
+    assert store.exists(pinned)
+
+def test_derived_lookup_invalidated_by_eviction(tmp_path):
+    store = ArtifactStore(root=str(tmp_path / "store"), max_age_s=0.05)
+    thumb = store.put_bytes(b"jpeg", suffix=".jpg", kind="thumbnail")
+    store.set_derived("digest", "thumbnails", [thumb])
+    assert store.get_derived("digest", "thumbnails") == [thumb]
+    time.sleep(0.1)
+    store.gc()
+    assert store.get_derived("digest", "thumbnails") is None
+
+def test_restart_adopts_existing_artifacts(tmp_path):
+    root = str(tmp_path / "store")
+    artifact_id = ArtifactStore(root=root).put_bytes(b"data", kind="template")
+    reopened = ArtifactStore(root=root)
+    assert reopened.exists(artifact_id)
+    assert reopened.stats()["by_kind"]["template"] == {"count": 1, "bytes": 4}
+
+def test_tmp_file_is_removed_unless_consumed(tmp_path):
+    store = ArtifactStore(root=str(tmp_path / "store"))
+    with pytest.raises(RuntimeError):
+        with store.tmp_file(".pptx") as path:
+            with open(path, "wb") as f:
+                f.write(b"partial")
+            raise RuntimeError("render failed")
+    assert not os.path.exists(path)
+
+    with store.tmp_file(".pptx") as path:
+        with open(path, "wb") as f:
+            f.write(b"deck")
+        artifact_id = store.put_file(path, kind="pptx", move=True)
+    assert store.read_bytes(artifact_id) == b"deck"
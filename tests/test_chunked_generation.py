@@ -0,0 +1,140 @@
+import os
+import time
+import threading
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+from core import llm_client
+from core.schemas import DeckSpec, DeckOutline, SectionPlan, TemplateProfile
+
+def _outline(counts):
+    return DeckOutline(
+        deck_title="Training",
+        sections=[SectionPlan(title=f"Section {i}", summary="...", slide_count=c) for i, c in enumerate(counts)]
+    )
+
+def test_allocate_chunks_matches_total_and_chunk_size():
+    cases = [
+        ([10, 40, 5, 30], 200),
+        ([1, 1, 100], 30),
+        ([1] * 40, 30),
+        ([0, 3], 1),
+        ([7], 300),
+    ]
+    for counts, total in cases:
+        chunks = llm_client._allocate_chunks(_outline(counts), total, 12)
+        assert sum(c["slide_count"] for c in chunks) == total, (counts, total)
+        assert all(1 <= c["slide_count"] <= 12 for c in chunks)
+        # Sections keep their order
+        assert [c["section_idx"] for c in chunks] == sorted(c["section_idx"] for c in chunks)
+
+def test_allocate_chunks_merges_surplus_sections():
+    chunks = llm_client._allocate_chunks(_outline([1] * 40), 30, 12)
+    assert len(chunks) == 30
+    assert "Section 0" in chunks[0]["title"]
+    assert "Section 39" in chunks[-1]["title"]
+
+def test_chunked_generation_retries_failed_chunk(monkeypatch):
+    monkeypatch.setattr(llm_client, "plan_sections", lambda prompt, n, tone: _outline([1, 1, 1]))
+    calls = []
+
+    def fake_generate(profile, prompt, slide_count, tone, template_path, images=None):
+        calls.append(prompt)
+        if len(calls) == 2:
+            raise ValueError("writer failed")
+        n = int(slide_count)
+        return DeckSpec(deck_title="chunk", slides=[
+            {"slide_id": str(i), "layout_id": 0, "fields": [{"key": "title", "value": f"t{i}"}]} for i in range(n)
+        ])
+
+    monkeypatch.setattr(llm_client, "_generate_deck", fake_generate)
+    seen = []
+    profile = TemplateProfile(template_name="t.pptx", layouts=[], allowed_layout_ids=[0])
+    deck = llm_client.generate_deck_chunked(
+        profile, "Topic", 30, "Formal", "", chunk_size=8,
+        on_chunk=lambda no, total, d: seen.append((no, total, len(d.slides)))
+    )
+
+    assert len(deck.slides) == 30
+    assert deck.deck_title == "Training"
+    assert [s.slide_id for s in deck.slides] == [f"s{i}" for i in range(1, 31)]
+    assert [no for no, _, _ in seen] == list(range(1, len(seen) + 1))
+    assert sum(n for _, _, n in seen) == 30
+    # One chunk failed once and was retried with the same prompt
+    assert len(calls) == len(seen) + 1
+    assert calls[1] == calls[2]
+
+def _fake_chunk(slide_count, layout_id=0):
+    return DeckSpec(deck_title="chunk", slides=[
+        {"slide_id": str(i), "layout_id": layout_id, "fields": [{"key": "title", "value": f"t{i}"}]}
+        for i in range(int(slide_count))
+    ])
+
+def test_chunk_with_unrenderable_layout_is_retried(monkeypatch):
+    monkeypatch.setattr(llm_client, "plan_sections", lambda prompt, n, tone: _outline([1, 1]))
+    calls = []
+
+    def fake_generate(profile, prompt, slide_count, tone, template_path, images=None):
+        calls.append(prompt)
+        # The first draft uses a layout the template doesn't have (a failed visual render)
+        return _fake_chunk(slide_count, layout_id=7 if len(calls) == 1 else 0)
+
+    monkeypatch.setattr(llm_client, "_generate_deck", fake_generate)
+    added = []
+    profile = TemplateProfile(template_name="t.pptx", layouts=[], allowed_layout_ids=[0])
+    deck = llm_client.generate_deck_chunked(
+        profile, "Topic", 30, "Formal", "", chunk_size=12,
+        on_chunk=lambda no, total, d: added.extend(s.layout_id for s in d.slides)
+    )
+    assert len(deck.slides) == 30
+    assert set(added) == {0}
+    assert calls[0] == calls[1]
+
+def test_coalesced_callers_run_their_own_callbacks(monkeypatch):
+    monkeypatch.setattr(llm_client, "plan_sections", lambda prompt, n, tone: _outline([1, 1]))
+    calls = []
+
+    def fake_generate(profile, prompt, slide_count, tone, template_path, images=None):
+        calls.append(prompt)
+        time.sleep(0.1)
+        return _fake_chunk(slide_count)
+
+    monkeypatch.setattr(llm_client, "_generate_deck", fake_generate)
+    profile = TemplateProfile(template_name="t.pptx", layouts=[], allowed_layout_ids=[0])
+
+    class Rerun(BaseException):
+        """Stand-in for Streamlit's RerunException, raised by a session's UI callback."""
+
+    def leader_callback(no, total, d):
+        raise Rerun()
+
+    follower_chunks = []
+    results = {}
+
+    def run(name, callback):
+        try:
+            results[name] = llm_client.generate_deck_chunked(profile, "Topic", 30, "Formal", "", chunk_size=15, on_chunk=callback)
+        except BaseException as e:
+            results[name] = e
+
+    leader = threading.Thread(target=run, args=("leader", leader_callback))
+    leader.start()
+    time.sleep(0.02)
+    follower = threading.Thread(target=run, args=("follower", lambda no, total, d: follower_chunks.append(no)))
+    follower.start()
+    leader.join()
+    follower.join()
+
+    assert isinstance(results["leader"], Rerun)
+    assert isinstance(results["follower"], DeckSpec) and len(results["follower"].slides) == 30
+    assert follower_chunks == [1, 2]
+
+def test_chunk_prompt_includes_its_section_source():
+    prompt = "\n".join(f"Module {i}: " + "lesson detail " * 40 for i in range(1, 201))
+    outline = DeckOutline(deck_title="Training", sections=[
+        SectionPlan(title="Intro", summary="...", slide_count=5, source_start=1, source_end=2),
+        SectionPlan(title="Late", summary="...", slide_count=5, source_start=190, source_end=191),
+    ])
+    chunks = llm_client._allocate_chunks(outline, 10, 12)
+    text = llm_client._chunk_prompt(prompt, outline, chunks[1], 2, 2)
+    assert "Module 190:" in text and "Module 191:" in text
+    assert "Module 150:" not in text
@@ -0,0 +1,127 @@
+import time
+import threading
+
+from core.coordinator import SingleFlight, AdmissionGate, input_hash, file_digest
+
+def test_input_hash_is_stable():
+    assert input_hash("a", {"x": 1, "y": 2}) == input_hash("a", {"y": 2, "x": 1})
+    assert input_hash("ab", "c") != input_hash("a", "bc")
+
+def test_file_digest_matches_content(tmp_path):
+    a = tmp_path / "a.pptx"
+    b = tmp_path / "b.pptx"
+    a.write_bytes(b"same")
+    b.write_bytes(b"same")
+    assert file_digest(str(a)) == file_digest(str(b))
+
+def test_singleflight_coalesces_concurrent_calls():
+    flight = SingleFlight("test")
+    calls = []
+    started = threading.Event()
+
+    def work():
+        calls.append(1)
+        started.set()
+        time.sleep(0.2)
+        return "deck"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do("k", work)))
+    leader.start()
+    started.wait()
+    followers = [threading.Thread(target=lambda: results.append(flight.do("k", work))) for _ in range(3)]
+    for t in followers:
+        t.start()
+    for t in [leader] + followers:
+        t.join()
+
+    assert results == ["deck"] * 4
+    assert len(calls) == 1
+    assert flight.stats()["coalesced"] == 3
+    assert flight.stats()["in_flight"] == 0
+
+def test_singleflight_keeps_leader_aborts_to_the_leader():
+    flight = SingleFlight("test")
+    started = threading.Event()
+
+    class Abort(BaseException):
+        """Stand-in for KeyboardInterrupt or a Streamlit rerun in the leader's session."""
+
+    def aborted():
+        started.set()
+        time.sleep(0.1)
+        raise Abort()
+
+    def failing():
+        started.set()
+        time.sleep(0.1)
+        raise ValueError("bad deck")
+
+    for leader_fn, expected in [(aborted, "deck"), (failing, ValueError)]:
+        started.clear()
+        results = {}
+
+        def lead():
+            try:
+                flight.do("k", leader_fn)
+            except BaseException as e:
+                results["leader"] = e
+
+        def follow():
+            try:
+                results["follower"] = flight.do("k", lambda: "deck")
+            except Exception as e:
+                results["follower"] = e
+
+        leader = threading.Thread(target=lead)
+        leader.start()
+        started.wait()
+        follower = threading.Thread(target=follow)
+        follower.start()
+        leader.join()
+        follower.join()
+
+        # Only real errors are shared; an abort makes the follower run the call itself
+        if expected == "deck":
+            assert isinstance(results["leader"], Abort)
+            assert results["follower"] == "deck"
+        else:
+            assert isinstance(results["follower"], ValueError)
+        assert flight.stats()["in_flight"] == 0
+
+def test_admission_gate_caps_concurrency():
+    gate = AdmissionGate("test", 2)
+    peak = []
+    lock = threading.Lock()
+    active = [0]
+
+    def job():
+        with gate.slot():
+            with lock:
+                active[0] += 1
+                peak.append(active[0])
+            time.sleep(0.05)
+            with lock:
+                active[0] -= 1
+
+    threads = [threading.Thread(target=job) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert max(peak) <= 2
+    stats = gate.stats()
+    assert stats["admitted"] == 6
+    assert stats["queue_depth"] == 0
+    assert stats["max_wait_s"] > 0
+
+def test_admission_gate_non_blocking_acquire():
+    gate = AdmissionGate("test", 1)
+    assert gate.acquire() is not None
+    assert gate.acquire(blocking=False) is None
+    assert gate.stats()["queue_depth"] == 0
+    gate.release()
+    assert gate.acquire(blocking=False) is not None
+    gate.release()
+    assert gate.stats()["active"] == 0
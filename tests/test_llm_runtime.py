@@ -0,0 +1,95 @@
+import time
+import pytest
+
+from core import llm_runtime
+from core.llm_runtime import NodeConfig, call_llm, get_node_config, set_llm_factory, latency_tracker
+
+class StubResponse:
+    def __init__(self, content):
+        self.content = content
+
+class StubModel:
+    """Local stand-in for ChatOpenAI: replays a script of delays/errors per call."""
+    def __init__(self, script):
+        self.script = list(script)
+        self.calls = 0
+
+    def with_structured_output(self, schema):
+        return self
+
+    def invoke(self, messages):
+        step = self.script[min(self.calls, len(self.script) - 1)]
+        self.calls += 1
+        delay, result = step
+        time.sleep(delay)
+        if isinstance(result, Exception):
+            raise result
+        return StubResponse(result)
+
+@pytest.fixture
+def stub(monkeypatch):
+    monkeypatch.setattr(llm_runtime, "backoff_delay", lambda *a: 0.0)
+    def install(script, **config):
+        model = StubModel(script)
+        monkeypatch.setitem(llm_runtime.NODE_DEFAULTS, "stub", NodeConfig(**config))
+        set_llm_factory(lambda cfg: model)
+        return model
+    yield install
+    set_llm_factory(None)
+
+def test_node_config_env_override(monkeypatch):
+    monkeypatch.setenv("PPTLLM_PLANNER_MODEL", "my-model")
+    monkeypatch.setenv("PPTLLM_PLANNER_TIMEOUT", "5")
+    config = get_node_config("planner")
+    assert config.model == "my-model"
+    assert config.timeout == 5.0
+    assert get_node_config("writer").model == llm_runtime.DEFAULT_MODEL
+
+def test_call_llm_retries_then_succeeds(stub):
+    model = stub([(0, RuntimeError("boom")), (0, "ok")], max_retries=2)
+    assert call_llm("stub", []).content == "ok"
+    assert model.calls == 2
+
+def test_call_llm_raises_after_retries(stub):
+    model = stub([(0, RuntimeError("boom"))], max_retries=1)
+    with pytest.raises(RuntimeError):
+        call_llm("stub", [])
+    assert model.calls == 2
+
+def test_call_llm_times_out(stub):
+    stub([(1.0, "late")], timeout=0.1, max_retries=0)
+    with pytest.raises(TimeoutError):
+        call_llm("stub", [])
+
+def test_hedged_request_wins_over_slow_primary(stub):
+    for _ in range(latency_tracker.min_samples):
+        latency_tracker.record("stub", 0.01)
+    model = stub([(1.0, "slow"), (0, "fast")], timeout=0.8, max_retries=0, hedge=True, hedge_min_delay=0.05)
+    start = time.perf_counter()
+    assert call_llm("stub", []).content == "fast"
+    assert time.perf_counter() - start < 0.5
+    assert model.calls == 2
+
+def test_timed_out_call_keeps_its_slot(stub, monkeypatch):
+    from core.coordinator import AdmissionGate
+    gate = AdmissionGate("llm", 2)
+    monkeypatch.setattr(llm_runtime.coordinator, "llm", gate)
+    stub([(0.4, "late")], timeout=0.1, max_retries=0)
+    with pytest.raises(TimeoutError):
+        call_llm("stub", [])
+    # The abandoned request is still running, so it still counts against the cap
+    assert gate.stats()["active"] == 1
+    time.sleep(0.5)
+    assert gate.stats()["active"] == 0
+
+def test_hedge_skipped_without_free_slot(stub, monkeypatch):
+    from core.coordinator import AdmissionGate
+    gate = AdmissionGate("llm", 1)
+    monkeypatch.setattr(llm_runtime.coordinator, "llm", gate)
+    for _ in range(latency_tracker.min_samples):
+        latency_tracker.record("stub", 0.01)
+    model = stub([(0.3, "slow"), (0, "fast")], timeout=1.0, max_retries=0, hedge=True, hedge_min_delay=0.05)
+    assert call_llm("stub", []).content == "slow"
+    assert model.calls == 1
+    time.sleep(0.05)
+    assert gate.stats()["active"] == 0
@@ -0,0 +1,41 @@
+from core.multi_agent import context_builder
+from core.schemas import TemplateProfile
+
+def _profile():
+    return TemplateProfile(**{
+        "template_name": "t.pptx",
+        "layouts": [{
+            "layout_id": 8,
+            "layout_name": "Picture with Caption",
+            "placeholders": [
+                {"key": "title", "type": "TITLE (1)", "idx": 0},
+                {"key": "image", "type": "PICTURE (18)", "idx": 1}
+            ]
+        }],
+        "allowed_layout_ids": [8]
+    })
+
+def test_picture_fields_hidden_without_images():
+    context = context_builder({"profile": _profile(), "available_images": {}})["layouts_context"]
+    assert "'image'" not in context
+    assert "'title'" in context
+
+def test_picture_fields_offered_with_real_images():
+    context = context_builder({"profile": _profile(), "available_images": {"abc.png": "logo.png"}})["layouts_context"]
+    assert "'image'" in context
+    assert "- abc.png: logo.png" in context
+
+def test_generate_deck_offers_images_to_the_writer(monkeypatch):
+    import os
+    os.environ.setdefault("OPENAI_API_KEY", "test-key")
+    from core import llm_client
+    from core.schemas import DeckSpec
+
+    captured = {}
+    def fake_invoke(state):
+        captured.update(state)
+        return {"draft_deck_spec": DeckSpec(deck_title="t", slides=[])}
+    monkeypatch.setattr(llm_client.app, "invoke", fake_invoke)
+
+    llm_client.generate_deck(_profile(), "Topic", "3", "Formal", "", images={"abc.png": "logo.png"})
+    assert captured["available_images"] == {"abc.png": "logo.png"}
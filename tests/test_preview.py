@@ -0,0 +1,107 @@
+import time
+from PIL import Image
+from pptx import Presentation
+
+from core import preview
+from core.artifact_store import ArtifactStore
+from core.preview import ThumbnailGallery, READY, UNAVAILABLE
+from core.schemas import DeckSpec, TemplateProfile
+
+def _deck(titles):
+    return DeckSpec(deck_title="Test", slides=[
+        {"slide_id": f"s{i}", "layout_id": 0, "fields": [{"key": "title", "value": t}]} for i, t in enumerate(titles)
+    ])
+
+def _wait(gallery, pptx_id):
+    for _ in range(100):
+        if gallery.status(pptx_id) != preview.PENDING:
+            return gallery.status(pptx_id)
+        time.sleep(0.02)
+
+def _setup(tmp_path, monkeypatch, exports):
+    store = ArtifactStore(root=str(tmp_path / "store"))
+    monkeypatch.setattr(preview, "store", store)
+
+    def fake_export(pptx_path, width=None):
+        exports.append(pptx_path)
+        assert width == preview.GALLERY_THUMB_WIDTH
+        paths = []
+        for i in range(3):
+            path = tmp_path / f"full_{len(exports)}_{i}.jpg"
+            Image.new("RGB", (1280, 720), (i * 60, 0, 0)).save(path)
+            paths.append(str(path))
+        return paths
+
+    monkeypatch.setattr(preview, "export_to_thumbnails", fake_export)
+    template = tmp_path / "template.pptx"
+    Presentation().save(template)
+    profile = TemplateProfile(template_name="template.pptx", layouts=[])
+    return store, str(template), profile
+
+def test_gallery_builds_downscaled_thumbnails_and_caches_slides(tmp_path, monkeypatch):
+    exports = []
+    store, template, profile = _setup(tmp_path, monkeypatch, exports)
+    gallery = ThumbnailGallery()
+
+    v1 = store.put_bytes(b"version 1", suffix=".pptx", kind="pptx")
+    gallery.request(v1, _deck(["a", "b", "c"]), template, profile)
+    assert _wait(gallery, v1) == READY
+    thumbs = gallery.thumbnails(v1)
+    assert len(thumbs) == 3
+    with Image.open(thumbs[0]) as img:
+        assert img.width == preview.GALLERY_THUMB_WIDTH
+    assert gallery.thumbnails(v1, start=1, count=1) == thumbs[1:2]
+
+    # Same slides in a new version (e.g. a re-render) need no conversion
+    v2 = store.put_bytes(b"version 2", suffix=".pptx", kind="pptx")
+    gallery.request(v2, _deck(["c", "a", "b"]), template, profile)
+    assert gallery.status(v2) == READY
+    assert len(exports) == 1
+    assert gallery.thumbnails(v2)[0] == thumbs[2]
+
+def test_gallery_marks_failed_versions_unavailable(tmp_path, monkeypatch):
+    exports = []
+    store, template, profile = _setup(tmp_path, monkeypatch, exports)
+    monkeypatch.setattr(preview, "export_to_thumbnails", lambda path, width=None: [])
+    gallery = ThumbnailGallery()
+
+    v1 = store.put_bytes(b"version 1", suffix=".pptx", kind="pptx")
+    gallery.request(v1, _deck(["a"]), template, profile)
+    assert _wait(gallery, v1) == UNAVAILABLE
+    assert gallery.thumbnails(v1) == []
+
+def test_gallery_retries_failed_versions_after_cooldown(tmp_path, monkeypatch):
+    exports = []
+    store, template, profile = _setup(tmp_path, monkeypatch, exports)
+    real_export = preview.export_to_thumbnails
+    monkeypatch.setattr(preview, "export_to_thumbnails", lambda path, width=None: [])
+    gallery = ThumbnailGallery(retry_after_s=0.1)
+
+    v1 = store.put_bytes(b"version 1", suffix=".pptx", kind="pptx")
+    gallery.request(v1, _deck(["a", "b", "c"]), template, profile)
+    assert _wait(gallery, v1) == UNAVAILABLE
+    assert "expected 3 slide images" in gallery.error(v1)
+
+    # Within the cooldown the failure sticks; afterwards the version is rebuilt
+    monkeypatch.setattr(preview, "export_to_thumbnails", real_export)
+    gallery.request(v1, _deck(["a", "b", "c"]), template, profile)
+    assert gallery.status(v1) == UNAVAILABLE
+    time.sleep(0.15)
+    gallery.request(v1, _deck(["a", "b", "c"]), template, profile)
+    assert _wait(gallery, v1) == READY
+    assert gallery.error(v1) is None
+
+def test_gallery_index_is_bounded(tmp_path, monkeypatch):
+    exports = []
+    store, template, profile = _setup(tmp_path, monkeypatch, exports)
+    gallery = ThumbnailGallery(max_versions=2, max_slides=4)
+
+    versions = []
+    for n in range(3):
+        v = store.put_bytes(f"version {n}".encode(), suffix=".pptx", kind="pptx")
+        gallery.request(v, _deck([f"{n}-a", f"{n}-b", f"{n}-c"]), template, profile)
+        assert _wait(gallery, v) == READY
+        versions.append(v)
+    assert gallery.status(versions[0]) is None
+    assert len(gallery._versions) == 2
+    assert len(gallery._slides) == 4
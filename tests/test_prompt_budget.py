@@ -0,0 +1,128 @@
+from core.prompt_budget import (
+    count_tokens,
+    truncate_to_tokens,
+    compact_deck_encoding,
+    summarize_outline,
+    compact_feedback,
+    record_prompt,
+    get_prompt_metrics,
+)
+from core.schemas import DeckSpec
+
+def _deck(n_slides=10):
+    return DeckSpec(
+        deck_title="Quarterly Review",
+        slides=[
+            {
+                "slide_id": f"s{i}",
+                "layout_id": 1,
+                "fields": [
+                    {"key": "title", "value": f"Slide {i}"},
+                    {"key": "body", "value": ["Revenue grew", "Costs fell", "Margin expanded"]}
+                ],
+                "notes": "Speak slowly"
+            }
+            for i in range(n_slides)
+        ]
+    )
+
+def test_compact_deck_encoding_is_smaller_and_keeps_ids():
+    deck = _deck()
+    compact = compact_deck_encoding(deck)
+    assert count_tokens(compact) < count_tokens(deck.model_dump_json())
+    assert "[s3] layout=1" in compact
+    assert "- Margin expanded" in compact
+    assert "notes: Speak slowly" in compact
+
+def test_truncate_to_tokens():
+    text = "word " * 500
+    out = truncate_to_tokens(text, 50)
+    assert count_tokens(out) <= 50
+    assert out.endswith("truncated to fit token budget ...]")
+    assert truncate_to_tokens("short", 50) == "short"
+
+def test_summarize_outline_keeps_headings():
+    outline = "\n\n".join(
+        f"Slide {i}: Heading {i}\n" + "\n".join(f"- detail {j} for slide {i} with some more words" for j in range(8))
+        for i in range(20)
+    )
+    budget = count_tokens(outline) // 3
+    out = summarize_outline(outline, budget)
+    assert count_tokens(out) <= budget
+    for i in range(20):
+        assert f"Slide {i}: Heading {i}" in out
+    assert summarize_outline("tiny", 100) == "tiny"
+
+def test_compact_feedback_dedupes():
+    feedback = "Text overflows on slide 2\ntext overflows on slide 2\n\nTitle too long"
+    assert compact_feedback(feedback) == "Text overflows on slide 2\nTitle too long"
+
+def test_record_prompt_accumulates():
+    record_prompt("test_node", 100, tokens_saved=40, latency_s=0.5)
+    record_prompt("test_node", 50)
+    metrics = get_prompt_metrics()["test_node"]
+    assert metrics["calls"] == 2
+    assert metrics["prompt_tokens"] == 150
+    assert metrics["tokens_saved"] == 40
+
+def test_mentioned_slides():
+    from core.prompt_budget import mentioned_slides
+    deck = _deck(200)
+    assert mentioned_slides(deck, "Make slide 3 and s150 punchier") == [2, 150]
+    assert mentioned_slides(deck, "merge slides 10-12") == [9, 10, 11]
+    assert mentioned_slides(deck, "fix slide 999") == []
+    assert mentioned_slides(deck, "shorten everything") == []
+
+def _edit_with_fake_graph(monkeypatch, deck, instruction, returned):
+    import os
+    os.environ.setdefault("OPENAI_API_KEY", "test-key")
+    from core import llm_client
+    from core.schemas import TemplateProfile
+
+    captured = {}
+    def fake_invoke(state):
+        captured.update(state)
+        return {"draft_deck_spec": returned}
+    monkeypatch.setattr(llm_client.app, "invoke", fake_invoke)
+    result = llm_client.edit_deck(TemplateProfile(template_name="t", layouts=[]), deck, instruction, "")
+    return result, captured
+
+def test_small_edit_sends_the_whole_deck(monkeypatch):
+    deck = _deck(5)
+    _, captured = _edit_with_fake_graph(monkeypatch, deck, "Make it punchier", _deck(5))
+    assert captured["prompt"].endswith(compact_deck_encoding(deck))
+    assert captured["slide_count"] == "5"
+
+def test_large_edit_rewrites_only_named_slides(monkeypatch):
+    from core.prompt_budget import PROMPT_TOKEN_BUDGET
+    deck = _deck(400)
+    edited = DeckSpec(deck_title="x", slides=[
+        {"slide_id": "new-a", "layout_id": 1, "fields": [{"key": "title", "value": "Punchy 3"}]},
+        {"slide_id": "new-b", "layout_id": 1, "fields": [{"key": "title", "value": "Punchy 3b"}]},
+    ])
+    instruction = "Make slide 3 punchier and split it in two"
+    result, captured = _edit_with_fake_graph(monkeypatch, deck, instruction, edited)
+    assert captured["prompt"].startswith(f"USER EDIT INSTRUCTION:\n{instruction}")
+    assert count_tokens(captured["prompt"]) <= PROMPT_TOKEN_BUDGET
+    assert captured["slide_count"] == "1"
+
+    # Every other slide keeps its full content; the extra slide is inserted after slide 3
+    assert len(result.slides) == 401
+    assert result.slides[2].slide_id == "s2" and result.slides[2].fields[0].value == "Punchy 3"
+    assert result.slides[3].fields[0].value == "Punchy 3b"
+    assert result.slides[3].slide_id not in {s.slide_id for s in deck.slides}
+    assert result.slides[4] == deck.slides[3]
+    assert result.slides[-1] == deck.slides[-1]
+
+def test_large_edit_without_named_slides_is_refused(monkeypatch):
+    import pytest
+    with pytest.raises(ValueError, match="too large to rewrite"):
+        _edit_with_fake_graph(monkeypatch, _deck(400), "Make every slide punchier", _deck(1))
+
+def test_number_lines_and_line_range():
+    from core.prompt_budget import number_lines, line_range
+    text = "Intro\n\n- point a\nDetails"
+    assert number_lines(text, 100) == "1| Intro\n3| - point a\n4| Details"
+    assert number_lines(text * 200, 50).startswith("1| Intro")
+    assert line_range(text, 3, 4) == "- point a\nDetails"
+    assert line_range(text, 0, 0) == ""
@@ -53,3 +53,210 @@ def test_renderer_creates_file(tmp_path):
     slide = out_prs.slides[0]
     # In a default template, shapes[0] is title, shapes[1] is subtitle
     assert slide.shapes[0].text == "Hello"    
+
+def test_progressive_renderer_appends_chunks(tmp_path):
+    from core.renderer import ProgressiveRenderer
+
+    dummy_template = tmp_path / "dummy.pptx"
+    # The template already holds a slide; only rendered slides are counted
+    template = Presentation()
+    template.slides.add_slide(template.slide_layouts[0])
+    template.save(dummy_template)
+    profile = TemplateProfile(
+        template_name="dummy.pptx",
+        layouts=[LayoutInfo(layout_id=0, layout_name="Title Slide", placeholders=[PlaceholderInfo(key="title", type="TITLE", idx=0)])],
+        allowed_layout_ids=[0]
+    )
+    renderer = ProgressiveRenderer(str(dummy_template), profile)
+    for chunk in range(3):
+        deck = DeckSpec(deck_title="Test", slides=[
+            {"slide_id": f"{chunk}-{i}", "layout_id": 0, "fields": [{"key": "title", "value": f"Chunk {chunk} slide {i}"}]}
+            for i in range(2)
+        ])
+        renderer.add_slides(deck.slides)
+    assert renderer.slide_count == 6
+
+    output_path = tmp_path / "output.pptx"
+    renderer.save(str(output_path))
+    out_prs = Presentation(output_path)
+    assert len(out_prs.slides) == 7
+    assert out_prs.slides[6].shapes[0].text == "Chunk 2 slide 1"
+
+def _picture_deck(n_slides, image):
+    return DeckSpec(deck_title="Test", slides=[
+        {"slide_id": f"s{i}", "layout_id": 8, "fields": [
+            {"key": "title", "value": f"Slide {i}"},
+            {"key": "image", "value": {"image": image}}
+        ]}
+        for i in range(n_slides)
+    ])
+
+def _picture_profile():
+    return TemplateProfile(
+        template_name="dummy.pptx",
+        layouts=[LayoutInfo(layout_id=8, layout_name="Picture with Caption", placeholders=[
+            PlaceholderInfo(key="title", type="TITLE", idx=0),
+            PlaceholderInfo(key="image", type="PICTURE", idx=1)
+        ])],
+        allowed_layout_ids=[8]
+    )
+
+def test_image_placeholders_dedupe_media(tmp_path, monkeypatch):
+    from PIL import Image
+    from core import media
+    from core.media import image_cache, IMAGE_MAX_PX
+
+    monkeypatch.setattr(media, "IMAGE_DIRS", [str(tmp_path)])
+    dummy_template = tmp_path / "dummy.pptx"
+    Presentation().save(dummy_template)
+    profile = _picture_profile()
+    logo = tmp_path / "logo.png"
+    Image.new("RGB", (IMAGE_MAX_PX * 2, IMAGE_MAX_PX), (200, 30, 30)).save(logo)
+
+    one = tmp_path / "one.pptx"
+    many = tmp_path / "many.pptx"
+    render_pptx(str(dummy_template), _picture_deck(1, str(logo)), str(one), profile)
+    hits_before = image_cache.stats()["hits"]
+    render_pptx(str(dummy_template), _picture_deck(40, str(logo)), str(many), profile)
+    assert image_cache.stats()["hits"] - hits_before == 40
+
+    out_prs = Presentation(many)
+    assert len(out_prs.slides) == 40
+    image_parts = {
+        rel.target_part.partname
+        for slide in out_prs.slides
+        for rel in slide.part.rels.values()
+        if rel.reltype.endswith("/image")
+    }
+    assert len(image_parts) == 1
+    picture = out_prs.slides[5].placeholders[1]
+    assert max(picture.image.size) == IMAGE_MAX_PX
+    # The image is stored once, so 39 extra slides add only slide XML
+    assert many.stat().st_size - one.stat().st_size < 40 * 4096
+
+def test_unsafe_or_invalid_images_are_skipped(tmp_path, monkeypatch):
+    from core import media
+
+    allowed = tmp_path / "images"
+    allowed.mkdir()
+    (allowed / "notes.png").write_bytes(b"not really a png")
+    monkeypatch.setattr(media, "IMAGE_DIRS", [str(allowed)])
+    dummy_template = tmp_path / "dummy.pptx"
+    Presentation().save(dummy_template)
+
+    refs = [
+        str(tmp_path / "missing.png"),
+        "/etc/passwd",
+        str(dummy_template),
+        str(allowed / ".." / "dummy.pptx"),
+        str(allowed / "notes.png"),
+    ]
+    for i, ref in enumerate(refs):
+        output_path = tmp_path / f"output_{i}.pptx"
+        render_pptx(str(dummy_template), _picture_deck(1, ref), str(output_path), _picture_profile())
+        slide = Presentation(output_path).slides[0]
+        assert not any(rel.reltype.endswith("/image") for rel in slide.part.rels.values())
+
+def test_image_from_artifact_store(tmp_path, monkeypatch):
+    from io import BytesIO
+    from PIL import Image
+    from core import media
+    from core.artifact_store import ArtifactStore
+
+    # A throwaway store, never the app's real one
+    store = ArtifactStore(root=str(tmp_path / "store"))
+    monkeypatch.setattr(media, "store", store)
+    buf = BytesIO()
+    Image.new("RGB", (64, 32), (0, 0, 255)).save(buf, "PNG")
+    artifact_id = store.put_bytes(buf.getvalue(), suffix=".png", kind="image")
+    dummy_template = tmp_path / "dummy.pptx"
+    Presentation().save(dummy_template)
+    output_path = tmp_path / "output.pptx"
+    render_pptx(str(dummy_template), _picture_deck(1, artifact_id), str(output_path), _picture_profile())
+    assert Presentation(output_path).slides[0].placeholders[1].image.size == (64, 32)
+
+def test_export_to_thumbnails_isolates_soffice_profile(tmp_path, monkeypatch):
+    from core import renderer
+    from core.artifact_store import ArtifactStore
+
+    monkeypatch.setattr(renderer, "store", ArtifactStore(root=str(tmp_path / "store")))
+    calls = []
+    monkeypatch.setattr(renderer.subprocess, "run", lambda args, **kw: calls.append(args))
+    for i in range(2):
+        pptx = tmp_path / f"deck{i}.pptx"
+        pptx.write_bytes(f"not a real deck {i}".encode())
+        # No PDF is produced by the stub, so there are no thumbnails
+        assert renderer.export_to_thumbnails(str(pptx)) == []
+
+    profiles = [next(a for a in args if a.startswith("-env:UserInstallation=file://")) for args in calls]
+    assert len(set(profiles)) == 2
+
+def test_export_to_thumbnails_writes_pages_to_disk_and_reuses_pdf(tmp_path, monkeypatch):
+    import os
+    from PIL import Image
+    from core import renderer
+    from core.artifact_store import ArtifactStore
+
+    monkeypatch.setattr(renderer, "store", ArtifactStore(root=str(tmp_path / "store")))
+    soffice_runs = []
+
+    def fake_soffice(args, **kw):
+        soffice_runs.append(args)
+        out_dir, pptx = args[args.index("--outdir") + 1], args[-1]
+        with open(os.path.join(out_dir, os.path.splitext(os.path.basename(pptx))[0] + ".pdf"), "wb") as f:
+            f.write(b"%PDF fake")
+
+    conversions = []
+
+    def fake_convert(pdf_path, output_folder=None, fmt=None, paths_only=False, size=None, **kw):
+        # Pages must be written by poppler into the scratch dir, never returned as in-memory images
+        assert paths_only and output_folder and fmt == "jpeg"
+        conversions.append(size)
+        width = size[0] if size else 2667
+        paths = []
+        for page in range(3):
+            path = os.path.join(output_folder, f"page-{page}.jpg")
+            Image.new("RGB", (width, width * 9 // 16), (page * 60, 0, 0)).save(path, "JPEG")
+            paths.append(path)
+        return paths
+
+    monkeypatch.setattr(renderer.subprocess, "run", fake_soffice)
+    monkeypatch.setattr(renderer, "convert_from_path", fake_convert)
+    pptx = tmp_path / "deck.pptx"
+    pptx.write_bytes(b"deck")
+
+    thumbs = renderer.export_to_thumbnails(str(pptx), width=320)
+    assert len(thumbs) == 3
+    with Image.open(thumbs[0]) as img:
+        assert img.width == 320
+    full = renderer.export_to_thumbnails(str(pptx))
+    assert len(full) == 3 and full != thumbs
+    # Cached per width; the PDF is converted by soffice only once
+    assert renderer.export_to_thumbnails(str(pptx), width=320) == thumbs
+    assert len(soffice_runs) == 1
+    assert conversions == [(320, None), None]
+
+def test_list_allowed_images_and_store_image(tmp_path, monkeypatch):
+    import io
+    import pytest
+    from PIL import Image
+    from core import media
+    from core.artifact_store import ArtifactStore
+
+    monkeypatch.setattr(media, "store", ArtifactStore(root=str(tmp_path / "store")))
+    (tmp_path / "imgs" / "sub").mkdir(parents=True)
+    Image.new("RGB", (8, 8)).save(tmp_path / "imgs" / "logo.png")
+    Image.new("RGB", (8, 8)).save(tmp_path / "imgs" / "sub" / "chart.jpg")
+    (tmp_path / "imgs" / "notes.txt").write_text("not an image")
+
+    listed = media.list_allowed_images([str(tmp_path / "imgs")])
+    assert sorted(listed.values()) == ["chart.jpg", "logo.png"]
+    assert len(media.list_allowed_images([str(tmp_path / "imgs")], limit=1)) == 1
+
+    buf = io.BytesIO()
+    Image.new("RGB", (8, 8)).save(buf, "PNG")
+    image_id = media.store_image(buf.getvalue(), "Logo.PNG")
+    assert image_id.endswith(".png")
+    assert media.resolve_image_path(image_id) == media.store.path(image_id)
+    with pytest.raises(ValueError):
+        media.store_image(b"not an image", "fake.png")
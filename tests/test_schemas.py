@@ -44,3 +44,9 @@ def test_template_profile_validation():
     assert profile.template_name == "Test.pptx"
     assert len(profile.layouts) == 1
     assert profile.allowed_layout_ids == [] # check default factory
+
+def test_slide_field_image_ref():
+    from core.schemas import SlideField, ImageRef
+    field = SlideField(key="image", value={"image": "logo.png"})
+    assert isinstance(field.value, ImageRef)
+    assert SlideField(key="title", value="Plain").value == "Plain"